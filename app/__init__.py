@@ -6,8 +6,9 @@ from flask_login import LoginManager
 from flask_mail import Mail
 from flask_migrate import Migrate
 from config import Config
+from app.replica import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login = LoginManager()
 login.login_view = 'auth.login'
 login.login_message = 'Please log in to access this page.'
@@ -26,6 +27,15 @@ def create_app(config_class=Config):
     mail.init_app(app)
     migrate.init_app(app, db)
 
+    from app.sqlite_profile import init_sqlite_profile
+    init_sqlite_profile(app)
+
+    from app.query_stats import init_query_stats
+    init_query_stats(app)
+
+    from app.payment.gateway import init_gateway
+    init_gateway(app)
+
     from app.auth import bp as auth_bp
     app.register_blueprint(auth_bp, url_prefix='/auth')
 
@@ -44,10 +54,23 @@ def create_app(config_class=Config):
     from app.admin import bp as admin_bp
     app.register_blueprint(admin_bp)
 
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix='/api')
+
     from app import models
+    from app.stats import init_stat_counters
+    init_stat_counters()
+    from app.identity import init_identity_cache
+    init_identity_cache()
     from app.routes import register_routes
     register_routes(app)
 
+    from app.cli import register_commands
+    register_commands(app)
+
+    from app.reports.content import render_report
+    app.jinja_env.globals['render_report'] = render_report
+
     return app
 
 def configure_logging(app):
@@ -0,0 +1,153 @@
+"""Research exports of completed assessments.
+
+Each assessment becomes one wide row: ids and timestamps, the answer to every
+question of the instrument (q1..qN, empty when unanswered) and the category
+and overall percentages scored from those answers, as in the reports.
+Assessments are read through a server-side cursor (yield_per) and scored a
+batch at a time, so memory stays flat however many rows are exported. With
+`since`, only assessments completed at or after that time are included, for
+incremental pulls.
+
+CSV is always available. Parquet needs pyarrow; each batch becomes one row
+group, and the bytes are yielded as they are written.
+"""
+import csv
+import io
+import numpy as np
+from sqlalchemy import select
+from app import db
+from app.models import Assessment
+from app.assessment.answers import load_answer_vectors, unpack_answers
+from app.assessment.scoring_engine import get_plan, UNANSWERED
+
+EXPORT_FORMATS = ['csv', 'parquet']
+
+BASE_COLUMNS = ['assessment_id', 'user_id', 'created_at', 'completed_at']
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_columns(assessment_type):
+    plan = get_plan(assessment_type)
+    return (BASE_COLUMNS
+            + [f'q{question_id}' for question_id in plan.question_ids]
+            + [f'{category}_score' for category in plan.categories]
+            + ['overall_score'])
+
+
+def _nullable(values):
+    # NaN marks a category with no answered questions
+    return [None if value != value else value for value in values]
+
+
+def iter_export_batches(assessment_type, since=None, batch_size=1000):
+    """Yield the export as dicts of column name -> list of values, one per batch"""
+    plan = get_plan(assessment_type)
+    query = select(
+        Assessment.id, Assessment.type, Assessment.answer_vector,
+        Assessment.user_id, Assessment.created_at, Assessment.completed_at
+    ).where(
+        Assessment.type == assessment_type,
+        Assessment.completed == True
+    )
+    if since is not None:
+        query = query.where(Assessment.completed_at >= since)
+    query = query.order_by(Assessment.id).execution_options(yield_per=batch_size)
+
+    for rows in db.session.execute(query).partitions():
+        vectors = load_answer_vectors([(row.id, row.type, row.answer_vector) for row in rows])
+        answers = np.stack([unpack_answers(vectors[row.id]) for row in rows])
+        scores = plan.score(answers)
+
+        columns = {
+            'assessment_id': [row.id for row in rows],
+            'user_id': [row.user_id for row in rows],
+            'created_at': [row.created_at for row in rows],
+            'completed_at': [row.completed_at for row in rows],
+        }
+        for i, question_id in enumerate(plan.question_ids):
+            columns[f'q{question_id}'] = [value if value != UNANSWERED else None for value in answers[:, i].tolist()]
+        percentages = scores.percentages.round(1)
+        for c, category in enumerate(plan.categories):
+            columns[f'{category}_score'] = _nullable(percentages[:, c].tolist())
+        columns['overall_score'] = _nullable(scores.overall.round(1).tolist())
+        yield columns
+
+
+def stream_csv(assessment_type, since=None, batch_size=1000):
+    """Yield the export as CSV text, the header first and then one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_columns(assessment_type))
+    yield buffer.getvalue()
+
+    for columns in iter_export_batches(assessment_type, since, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(zip(*columns.values()))
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file collecting bytes until they are drained"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema(assessment_type):
+    import pyarrow as pa
+
+    plan = get_plan(assessment_type)
+    return pa.schema(
+        [('assessment_id', pa.int64()), ('user_id', pa.int64()),
+         ('created_at', pa.timestamp('us')), ('completed_at', pa.timestamp('us'))]
+        + [(f'q{question_id}', pa.uint8()) for question_id in plan.question_ids]
+        + [(f'{category}_score', pa.float64()) for category in plan.categories]
+        + [('overall_score', pa.float64())]
+    )
+
+
+def stream_parquet(assessment_type, since=None, batch_size=1000):
+    """Yield the export as Parquet bytes, one row group per batch (requires pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(assessment_type)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for columns in iter_export_batches(assessment_type, since, batch_size):
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+    # The footer is written when the writer closes
+    yield sink.drain()
+
+
+def stream_export(assessment_type, export_format='csv', since=None, batch_size=1000):
+    """Yield the export in `export_format` ('csv' or 'parquet')"""
+    if export_format == 'parquet':
+        return stream_parquet(assessment_type, since, batch_size)
+    return stream_csv(assessment_type, since, batch_size)
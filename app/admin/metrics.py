@@ -0,0 +1,142 @@
+"""Daily metric rollups for admin analytics.
+
+DailyMetric holds one value per (day, metric): signups, assessments started
+and completed per type, successful payments and revenue. Days are computed
+from index-friendly created_at/completed_at range queries and rewritten
+whole, so recomputing a day is idempotent.
+
+The 'daily-metrics' checkpoint is the watermark: the first day not yet
+final. `flask metrics rollup` recomputes from the watermark (less
+DAILY_METRICS_LOOKBACK_DAYS, for payments that succeed a few days after they
+are created) through today; `flask metrics backfill` recomputes any range.
+"""
+import time
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, insert, delete
+from app import db
+from app.models import User, Assessment, Payment, DailyMetric, JobCheckpoint
+
+CHECKPOINT_NAME = 'daily-metrics'
+
+DayCount = namedtuple('DayCount', ['date', 'count'])
+DayRevenue = namedtuple('DayRevenue', ['date', 'count', 'revenue'])
+
+
+def _as_date(value):
+    # func.date() returns a string on SQLite and a date on PostgreSQL
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _today():
+    # Timestamps are stored in UTC
+    return datetime.utcnow().date()
+
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def compute_daily_metrics(start, end):
+    """Map (day, metric) -> value for days in [start, end)"""
+    start_at, end_at = _day_start(start), _day_start(end)
+    metrics = defaultdict(int)
+
+    day = func.date(User.created_at)
+    for d, n in db.session.query(day, func.count(User.id)).filter(
+        User.created_at >= start_at, User.created_at < end_at
+    ).group_by(day):
+        metrics[_as_date(d), 'signups'] += n
+
+    day = func.date(Assessment.created_at)
+    for d, assessment_type, n in db.session.query(day, Assessment.type, func.count(Assessment.id)).filter(
+        Assessment.created_at >= start_at, Assessment.created_at < end_at
+    ).group_by(day, Assessment.type):
+        metrics[_as_date(d), f'started_{assessment_type}'] += n
+
+    day = func.date(Assessment.completed_at)
+    for d, assessment_type, n in db.session.query(day, Assessment.type, func.count(Assessment.id)).filter(
+        Assessment.completed_at >= start_at, Assessment.completed_at < end_at,
+        Assessment.completed == True
+    ).group_by(day, Assessment.type):
+        metrics[_as_date(d), f'completed_{assessment_type}'] += n
+
+    day = func.date(Payment.created_at)
+    for d, n, revenue in db.session.query(day, func.count(Payment.id), func.sum(Payment.amount)).filter(
+        Payment.created_at >= start_at, Payment.created_at < end_at,
+        Payment.status == 'succeeded'
+    ).group_by(day):
+        metrics[_as_date(d), 'payments_succeeded'] += n
+        metrics[_as_date(d), 'revenue_cents'] += revenue or 0
+
+    return metrics
+
+
+def store_daily_metrics(start, end, metrics):
+    """Replace the stored rollups for days in [start, end); the caller commits"""
+    db.session.execute(delete(DailyMetric).where(DailyMetric.day >= start, DailyMetric.day < end))
+    rows = [{'day': day, 'metric': metric, 'value': value} for (day, metric), value in metrics.items() if value]
+    if rows:
+        db.session.execute(insert(DailyMetric), rows)
+
+
+def _earliest_day():
+    earliest = db.session.query(func.min(User.created_at)).scalar()
+    return earliest.date() if earliest else _today()
+
+
+def backfill_daily_metrics(start=None, end=None, chunk_days=30, echo=print):
+    """Recompute the rollups for [start, end) in chunks, one commit per chunk"""
+    start = start or _earliest_day()
+    end = end or _today() + timedelta(days=1)
+    total = 0
+    started = time.monotonic()
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+        metrics = compute_daily_metrics(chunk_start, chunk_end)
+        store_daily_metrics(chunk_start, chunk_end, metrics)
+
+        # Days before today are final, so the watermark moves past them
+        checkpoint = JobCheckpoint.get(CHECKPOINT_NAME)
+        watermark = min(chunk_end, _today())
+        if checkpoint.position is None or date.fromisoformat(checkpoint.position) < watermark:
+            checkpoint.position = watermark.isoformat()
+        db.session.commit()
+
+        total += (chunk_end - chunk_start).days
+        echo(f'Rolled up {total} days through {chunk_end - timedelta(days=1)}, '
+             f'{total / (time.monotonic() - started):.0f} days/s')
+        chunk_start = chunk_end
+    return total
+
+
+def rollup_daily_metrics(echo=print):
+    """Bring the rollups up to date from the watermark"""
+    checkpoint = JobCheckpoint.get(CHECKPOINT_NAME)
+    if checkpoint.position is None:
+        start = _earliest_day()
+    else:
+        lookback = timedelta(days=current_app.config['DAILY_METRICS_LOOKBACK_DAYS'])
+        start = date.fromisoformat(checkpoint.position) - lookback
+    return backfill_daily_metrics(start, echo=echo)
+
+
+def daily_series(start, end):
+    """Analytics series for days in [start, end), read only from the rollups"""
+    values = defaultdict(lambda: defaultdict(int))
+    for day, metric, value in db.session.query(DailyMetric.day, DailyMetric.metric, DailyMetric.value).filter(
+        DailyMetric.day >= start, DailyMetric.day < end
+    ):
+        values[day][metric] = value
+
+    days = sorted(values)
+    completed = [DayCount(day, sum(n for metric, n in values[day].items() if metric.startswith('completed_')))
+                 for day in days]
+    return {
+        'daily_users': [DayCount(day, values[day]['signups']) for day in days if values[day]['signups']],
+        'daily_assessments': [row for row in completed if row.count],
+        'daily_payments': [DayRevenue(day, values[day]['payments_succeeded'], values[day]['revenue_cents'])
+                           for day in days if values[day]['payments_succeeded']],
+    }
@@ -1,11 +1,21 @@
-from flask import render_template, redirect, url_for, flash, request, abort
+from flask import render_template, redirect, url_for, flash, request, abort, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from functools import wraps
 from app import db
 from app.admin import bp
-from app.models import User, Assessment, Payment, Response, Report
+from app.models import User, Assessment, Payment, Report
+from app.assessment.answers import answered_items
+from app.stats import get_counters
+from app.admin.metrics import daily_series
+from app.admin.export import EXPORT_FORMATS, parquet_available, stream_export
+from app.pagination import keyset_paginate
+from app.query_stats import query_budget
 from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload, load_only
+from datetime import date, datetime, timedelta
+
+# ?days= on the analytics page is clamped to this range
+ANALYTICS_MAX_DAYS = 3650
 
 def admin_required(f):
     """Decorator to require admin access"""
@@ -16,17 +26,32 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+@bp.before_request
+def read_from_replica():
+    """Admin pages only read, so their queries may go to the read replica (see app.replica)"""
+    # The signed-in user is loaded from the primary first
+    if request.method == 'GET' and current_user.is_authenticated:
+        db.session.info['use_replica'] = True
+
+def approximate_total(*names):
+    """Sum of the named stat counters, or None when totals are disabled or a name is None"""
+    if None in names or not current_app.config['ADMIN_APPROXIMATE_TOTALS']:
+        return None
+    counters = get_counters()
+    return sum(counters.get(name, 0) for name in names)
+
 @bp.route('/admin')
 @login_required
 @admin_required
 def index():
     """Admin dashboard with overview statistics"""
-    # Get basic statistics
-    total_users = User.query.count()
-    total_assessments = Assessment.query.count()
-    completed_assessments = Assessment.query.filter_by(completed=True).count()
-    total_payments = Payment.query.count()
-    successful_payments = Payment.query.filter_by(status='succeeded').count()
+    # Get basic statistics from the maintained counters (see app.stats)
+    counters = get_counters()
+    total_users = counters.get('users', 0)
+    total_assessments = counters.get('assessments', 0)
+    completed_assessments = counters.get('assessments_completed', 0)
+    total_payments = counters.get('payments', 0)
+    successful_payments = counters.get('payments_succeeded', 0)
 
     # Get recent activity
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
@@ -34,12 +59,11 @@ def index():
     recent_assessments = Assessment.query.order_by(Assessment.created_at.desc()).limit(5).all()
 
     # Revenue statistics
-    total_revenue = db.session.query(func.sum(Payment.amount)).filter_by(status='succeeded').scalar() or 0
-    total_revenue_dollars = total_revenue / 100  # Convert from cents to dollars
+    total_revenue_dollars = counters.get('revenue_cents', 0) / 100  # Convert from cents to dollars
 
     # Assessment type breakdown
-    simple_assessments = Assessment.query.filter_by(type='simple').count()
-    premium_assessments = Assessment.query.filter_by(type='premium').count()
+    simple_assessments = counters.get('assessments_simple', 0)
+    premium_assessments = counters.get('assessments_premium', 0)
 
     return render_template('admin/dashboard.html',
                          total_users=total_users,
@@ -57,12 +81,25 @@ def index():
 @bp.route('/admin/users')
 @login_required
 @admin_required
+@query_budget(6)
 def users():
     """View all users"""
-    page = request.args.get('page', 1, type=int)
-    users = User.query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
-    return render_template('admin/users.html', users=users)
+    users = keyset_paginate(User.query, User.created_at, User.id,
+                            current_app.config['ADMIN_PER_PAGE'], request.args.get('cursor'))
+
+    # Per-user counts for this page in one grouped query each, instead of three per row
+    user_ids = [user.id for user in users.items]
+    assessment_counts = dict(db.session.query(Assessment.user_id, func.count(Assessment.id)).filter(
+        Assessment.user_id.in_(user_ids)).group_by(Assessment.user_id))
+    report_counts = dict(db.session.query(Assessment.user_id, func.count(Report.id)).join(Report.assessment).filter(
+        Assessment.user_id.in_(user_ids)).group_by(Assessment.user_id))
+    payment_counts = dict(db.session.query(Payment.user_id, func.count(Payment.id)).filter(
+        Payment.user_id.in_(user_ids)).group_by(Payment.user_id))
+
+    return render_template('admin/users.html', users=users, total=approximate_total('users'),
+                         assessment_counts=assessment_counts,
+                         report_counts=report_counts,
+                         payment_counts=payment_counts)
 
 @bp.route('/admin/user/<int:user_id>')
 @login_required
@@ -77,34 +114,36 @@ def user_detail(user_id):
 @bp.route('/admin/payments')
 @login_required
 @admin_required
+@query_budget(4)
 def payments():
     """View all payments"""
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
 
-    query = Payment.query
+    query = Payment.query.options(joinedload(Payment.user).load_only(User.id, User.email))
     if status_filter:
         query = query.filter_by(status=status_filter)
 
-    payments = query.order_by(Payment.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    payments = keyset_paginate(query, Payment.created_at, Payment.id,
+                               current_app.config['ADMIN_PER_PAGE'], request.args.get('cursor'))
+    counter = {'': 'payments', 'succeeded': 'payments_succeeded'}.get(status_filter)
 
     # Get unique statuses for filter dropdown
     statuses = db.session.query(Payment.status).distinct().all()
     statuses = [status[0] for status in statuses]
 
-    return render_template('admin/payments.html', payments=payments, statuses=statuses, current_status=status_filter)
+    return render_template('admin/payments.html', payments=payments, statuses=statuses, current_status=status_filter,
+                         total=approximate_total(counter))
 
 @bp.route('/admin/assessments')
 @login_required
 @admin_required
+@query_budget(4)
 def assessments():
     """View all assessments"""
-    page = request.args.get('page', 1, type=int)
     type_filter = request.args.get('type', '')
     status_filter = request.args.get('status', '')
 
-    query = Assessment.query
+    query = Assessment.query.options(joinedload(Assessment.user).load_only(User.id, User.email))
     if type_filter:
         query = query.filter_by(type=type_filter)
     if status_filter == 'completed':
@@ -112,11 +151,25 @@ def assessments():
     elif status_filter == 'in_progress':
         query = query.filter_by(completed=False)
 
-    assessments = query.order_by(Assessment.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    assessments = keyset_paginate(query, Assessment.created_at, Assessment.id,
+                                  current_app.config['ADMIN_PER_PAGE'], request.args.get('cursor'))
+
+    # Counters exist per type and for completed assessments, not for each combination
+    total = None
+    if not type_filter and not status_filter:
+        total = approximate_total('assessments')
+    elif not status_filter:
+        total = approximate_total(f'assessments_{type_filter}')
+    elif not type_filter and status_filter == 'completed':
+        total = approximate_total('assessments_completed')
+    elif not type_filter and status_filter == 'in_progress':
+        total = approximate_total('assessments')
+        if total is not None:
+            total -= approximate_total('assessments_completed')
 
     return render_template('admin/assessments.html',
                          assessments=assessments,
+                         total=total,
                          current_type=type_filter,
                          current_status=status_filter)
 
@@ -126,7 +179,7 @@ def assessments():
 def assessment_detail(assessment_id):
     """View detailed information about a specific assessment"""
     assessment = Assessment.query.get_or_404(assessment_id)
-    responses = Response.query.filter_by(assessment_id=assessment_id).order_by(Response.question_id).all()
+    responses = answered_items(assessment)
     reports = Report.query.filter_by(assessment_id=assessment_id).order_by(Report.generated_at.desc()).all()
     return render_template('admin/assessment_detail.html',
                          assessment=assessment,
@@ -136,53 +189,80 @@ def assessment_detail(assessment_id):
 @bp.route('/admin/reports')
 @login_required
 @admin_required
+@query_budget(4)
 def reports():
     """View all reports"""
-    page = request.args.get('page', 1, type=int)
-    reports = Report.query.order_by(Report.generated_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
-    return render_template('admin/reports.html', reports=reports)
+    # List columns only; report bodies are loaded by report_detail
+    query = Report.query.options(
+        load_only(Report.id, Report.assessment_id, Report.generated_at),
+        joinedload(Report.assessment).load_only(Assessment.id, Assessment.user_id, Assessment.type)
+        .joinedload(Assessment.user).load_only(User.id, User.email)
+    )
+    reports = keyset_paginate(query, Report.generated_at, Report.id,
+                              current_app.config['ADMIN_PER_PAGE'], request.args.get('cursor'))
+    return render_template('admin/reports.html', reports=reports, total=approximate_total('reports'))
+
+@bp.route('/admin/report/<int:report_id>')
+@login_required
+@admin_required
+def report_detail(report_id):
+    """View a single report"""
+    report = Report.query.options(
+        joinedload(Report.assessment).joinedload(Assessment.user)
+    ).get_or_404(report_id)
+    return render_template('admin/report_detail.html', report=report)
+
+@bp.route('/admin/export')
+@login_required
+@admin_required
+def export():
+    """Download completed assessments as CSV or Parquet, streamed as they are read"""
+    assessment_type = request.args.get('type', 'premium')
+    export_format = request.args.get('format', 'csv')
+    if assessment_type not in ('simple', 'premium') or export_format not in EXPORT_FORMATS:
+        abort(400)
+    if export_format == 'parquet' and not parquet_available():
+        flash('Parquet export requires pyarrow to be installed.')
+        return redirect(url_for('admin.index'))
+
+    # Incremental exports: only assessments completed at or after `since`
+    since = request.args.get('since', '')
+    try:
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        abort(400)
+
+    chunks = stream_export(assessment_type, export_format, since, current_app.config['EXPORT_BATCH_SIZE'])
+    filename = f'{assessment_type}-assessments.{export_format}'
+    return Response(stream_with_context(chunks),
+                    mimetype='text/csv' if export_format == 'csv' else 'application/vnd.apache.parquet',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 @bp.route('/admin/analytics')
 @login_required
 @admin_required
 def analytics():
     """View analytics and insights"""
-    # Get data for the last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-
-    # User registration over time
-    daily_users = db.session.query(
-        func.date(User.created_at).label('date'),
-        func.count(User.id).label('count')
-    ).filter(User.created_at >= thirty_days_ago).group_by(
-        func.date(User.created_at)
-    ).order_by('date').all()
-
-    # Assessment completion over time
-    daily_assessments = db.session.query(
-        func.date(Assessment.completed_at).label('date'),
-        func.count(Assessment.id).label('count')
-    ).filter(
-        Assessment.completed_at >= thirty_days_ago,
-        Assessment.completed == True
-    ).group_by(
-        func.date(Assessment.completed_at)
-    ).order_by('date').all()
-
-    # Payment success over time
-    daily_payments = db.session.query(
-        func.date(Payment.created_at).label('date'),
-        func.count(Payment.id).label('count'),
-        func.sum(Payment.amount).label('revenue')
-    ).filter(
-        Payment.created_at >= thirty_days_ago,
-        Payment.status == 'succeeded'
-    ).group_by(
-        func.date(Payment.created_at)
-    ).order_by('date').all()
+    # Read a date range from the daily rollups: ?days=N, or ?start=YYYY-MM-DD&end=YYYY-MM-DD (both inclusive)
+    try:
+        last_day = date.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow().date()
+        end = last_day + timedelta(days=1)
+        if request.args.get('start'):
+            start = date.fromisoformat(request.args['start'])
+        else:
+            days = min(max(request.args.get('days', 30, type=int), 1), ANALYTICS_MAX_DAYS)
+            start = end - timedelta(days=days)
+    except ValueError:
+        flash('Invalid date range')
+        return redirect(url_for('admin.analytics'))
+
+    series = daily_series(start, end)
+    if request.args.get('start'):
+        range_label = f'{start} to {last_day}'
+    else:
+        range_label = f'Last {(end - start).days} Days'
 
     return render_template('admin/analytics.html',
-                         daily_users=daily_users,
-                         daily_assessments=daily_assessments,
-                         daily_payments=daily_payments)
\ No newline at end of file
+                         range_label=range_label,
+                         days=(end - start).days,
+                         **series)
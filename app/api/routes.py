@@ -0,0 +1,65 @@
+import hmac
+import logging
+from functools import wraps
+from flask import request, jsonify, current_app
+from app.api import bp
+from app.assessment.scoring_engine import get_plan
+
+logger = logging.getLogger(__name__)
+
+def api_key_required(f):
+    """Decorator to require a partner API key in the X-API-Key header"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        api_key = request.headers.get('X-API-Key', '')
+        valid_keys = current_app.config['SCORING_API_KEYS']
+        if not api_key or not any(hmac.compare_digest(api_key, key) for key in valid_keys):
+            return jsonify({'error': 'Invalid or missing API key'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+@bp.route('/score', methods=['POST'])
+@api_key_required
+def score():
+    """Score a batch of answer vectors for the simple or premium assessment"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+
+    instrument = data.get('instrument', 'premium')
+    answers = data.get('answers')
+    if not isinstance(answers, list) or not answers:
+        return jsonify({'error': 'answers must be a non-empty list of answer vectors'}), 400
+
+    batch_limit = current_app.config['SCORING_BATCH_LIMIT']
+    if len(answers) > batch_limit:
+        return jsonify({'error': f'At most {batch_limit} answer vectors per request'}), 413
+
+    try:
+        plan = get_plan(instrument)
+        scores = plan.score(answers)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    logger.info(f"Scored {len(answers)} {instrument} answer vectors")
+
+    # Round once over the whole matrix, then convert to plain lists for JSON
+    percentages = scores.percentages.round(1).tolist()
+    overall = scores.overall.round(1).tolist()
+    results = []
+    for row_percentages, row_overall in zip(percentages, overall):
+        results.append({
+            'overall_score': None if row_overall != row_overall else row_overall,
+            'scores': {
+                category: (None if value != value else value)
+                for category, value in zip(plan.categories, row_percentages)
+            }
+        })
+
+    return jsonify({
+        'instrument': instrument,
+        'categories': plan.categories,
+        'question_ids': plan.question_ids,
+        'count': len(results),
+        'results': results
+    })
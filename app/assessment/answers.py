@@ -0,0 +1,248 @@
+"""Answer storage for assessments.
+
+Answers are kept either as one Response row per question ('rows') or packed
+into Assessment.answer_vector ('packed'): one byte per question holding the
+1-5 Likert value, with 0 marking an unanswered question. The storage mode is
+chosen by ANSWER_STORAGE when an assessment is created; an assessment with a
+non-null answer_vector is always read and written in packed mode.
+
+In both modes the assessment also carries answered_count and answered_bitmap
+(bit i set when plan question i is answered), updated in the same transaction
+as every answer write, so resume and completion checks only read the
+assessment row. save_answers re-reads the row under a write lock before
+changing the bitmap, count or vector, so two concurrent saves to one
+assessment (say, two tabs) are applied one after the other instead of one
+overwriting the other's answers. On PostgreSQL that is SELECT ... FOR UPDATE.
+SQLite has no row locks and pysqlite starts no transaction for a SELECT, so
+there the transaction is begun with BEGIN IMMEDIATE, taking the database write
+lock (waiting up to SQLITE_BUSY_TIMEOUT for it) before the row is read.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import insert, update, delete
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import db
+from app.models import Assessment, Response, JobCheckpoint
+from app.assessment.scoring_engine import get_plan, parse_answer, ANSWER_LABELS, UNANSWERED
+
+# Plain stand-in for Response rows when only (question_id, answer) is loaded
+ResponseRow = namedtuple('ResponseRow', ['question_id', 'answer'])
+
+# Row shown on the admin assessment page; created_at is unknown for packed answers
+AnsweredItem = namedtuple('AnsweredItem', ['question_id', 'answer', 'created_at'])
+
+ANSWER_TEXT = {value: label.title() for label, value in ANSWER_LABELS.items()}
+
+# Dialects whose INSERT supports ON CONFLICT, used to upsert Response rows
+UPSERT_INSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert,
+}
+
+
+def is_packed(assessment):
+    return assessment.answer_vector is not None
+
+
+def init_answer_storage(assessment):
+    """Set up storage for a new assessment according to ANSWER_STORAGE"""
+    question_count = get_plan(assessment.type).question_count
+    if current_app.config['ANSWER_STORAGE'] == 'packed':
+        assessment.answer_vector = bytes(question_count)
+    assessment.answered_count = 0
+    assessment.answered_bitmap = bytes((question_count + 7) // 8)
+
+
+def answered_mask(assessment):
+    """Boolean array of which plan questions have been answered"""
+    if assessment.answered_bitmap is None:
+        return get_answers(assessment) != UNANSWERED
+    bits = np.frombuffer(assessment.answered_bitmap, dtype=np.uint8)
+    return np.unpackbits(bits, count=get_plan(assessment.type).question_count, bitorder='little').astype(bool)
+
+
+def answered_count(assessment):
+    if assessment.answered_count is None:
+        return int(answered_mask(assessment).sum())
+    return assessment.answered_count
+
+
+def is_fully_answered(assessment):
+    return answered_count(assessment) >= get_plan(assessment.type).question_count
+
+
+def _mark_answered(assessment, plan, question_ids):
+    """Set the answered bits and count for newly answered questions"""
+    mask = answered_mask(assessment).copy()
+    mask[[plan.index[question_id] for question_id in question_ids]] = True
+    assessment.answered_bitmap = np.packbits(mask, bitorder='little').tobytes()
+    assessment.answered_count = int(mask.sum())
+
+
+def _lock_assessment(assessment):
+    """Reload the assessment row, locked against concurrent writers until the transaction ends"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+    db.session.refresh(assessment, with_for_update=True)
+
+
+def pack_answers(answers):
+    return np.asarray(answers, dtype=np.uint8).tobytes()
+
+
+def unpack_answers(answer_vector):
+    return np.frombuffer(answer_vector, dtype=np.uint8)
+
+
+def get_answers(assessment):
+    """Return the assessment's answer vector (0 = unanswered)"""
+    if is_packed(assessment):
+        return unpack_answers(assessment.answer_vector)
+    return get_plan(assessment.type).answers_from_responses(assessment.responses.all())
+
+
+def save_answer(assessment, question_id, answer):
+    """Record (or replace) the answer to one question; the caller commits"""
+    save_answers(assessment, {question_id: answer})
+
+
+def save_answers(assessment, answers):
+    """Record (or replace) answers to several questions at once; the caller commits.
+
+    Row storage writes all responses with a single INSERT ... ON CONFLICT DO
+    UPDATE on (assessment_id, question_id) where the database supports it.
+    """
+    # Lock the row and reload it, so another save's bits and answers are kept
+    _lock_assessment(assessment)
+    plan = get_plan(assessment.type)
+    _mark_answered(assessment, plan, answers)
+    if is_packed(assessment):
+        vector = bytearray(assessment.answer_vector)
+        for question_id, answer in answers.items():
+            vector[plan.index[question_id]] = parse_answer(answer)
+        assessment.answer_vector = bytes(vector)
+        return
+
+    now = datetime.utcnow()
+    rows = [{
+        'assessment_id': assessment.id,
+        'question_id': question_id,
+        'answer': answer,
+        'created_at': now
+    } for question_id, answer in answers.items()]
+
+    upsert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if upsert is not None:
+        statement = upsert(Response)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['assessment_id', 'question_id'],
+            set_={'answer': statement.excluded.answer, 'created_at': statement.excluded.created_at}
+        ), rows)
+        return
+
+    existing_responses = {response.question_id: response for response in Response.query.filter(
+        Response.assessment_id == assessment.id,
+        Response.question_id.in_(list(answers))
+    )}
+    new_responses = []
+    for row in rows:
+        existing_response = existing_responses.get(row['question_id'])
+        if existing_response:
+            existing_response.answer = row['answer']
+            existing_response.created_at = now
+        else:
+            new_responses.append(row)
+    if new_responses:
+        db.session.execute(insert(Response), new_responses)
+
+
+def next_question_id(assessment):
+    """Return the first unanswered question id, or None if all are answered"""
+    plan = get_plan(assessment.type)
+    unanswered = np.flatnonzero(~answered_mask(assessment))
+    if not len(unanswered):
+        return None
+    return plan.question_ids[unanswered[0]]
+
+
+def answered_items(assessment):
+    """List answered questions in question order for display"""
+    if not is_packed(assessment):
+        return [AnsweredItem(r.question_id, r.answer, r.created_at)
+                for r in assessment.responses.order_by(Response.question_id)]
+
+    plan = get_plan(assessment.type)
+    return [AnsweredItem(question_id, ANSWER_TEXT[value] if assessment.type == 'simple' else str(value), None)
+            for question_id, value in zip(plan.question_ids, unpack_answers(assessment.answer_vector).tolist())
+            if value != UNANSWERED]
+
+
+def load_answer_vectors(assessments):
+    """Map assessment id -> packed answers for (id, type, answer_vector) rows.
+
+    Assessments still in row storage are packed from their Response rows with a
+    single query for the whole batch.
+    """
+    vectors = {}
+    unpacked = {}
+    for assessment_id, assessment_type, answer_vector in assessments:
+        if answer_vector is not None:
+            vectors[assessment_id] = answer_vector
+        else:
+            unpacked[assessment_id] = assessment_type
+
+    if unpacked:
+        responses = {assessment_id: [] for assessment_id in unpacked}
+        rows = db.session.query(Response.assessment_id, Response.question_id, Response.answer).filter(
+            Response.assessment_id.in_(list(unpacked))
+        ).order_by(Response.assessment_id, Response.id)
+        for assessment_id, question_id, answer in rows:
+            responses[assessment_id].append(ResponseRow(question_id, answer))
+        for assessment_id, assessment_type in unpacked.items():
+            answers = get_plan(assessment_type).answers_from_responses(responses[assessment_id])
+            vectors[assessment_id] = pack_answers(answers)
+
+    return vectors
+
+
+def pack_existing_answers(chunk_size=1000, delete_rows=False, restart=False, echo=print):
+    """Migrate assessments from Response rows to packed answer vectors (resumable)"""
+    checkpoint = JobCheckpoint.get('answers-pack')
+    if restart or checkpoint.position is None:
+        checkpoint.position = '0'
+        db.session.commit()
+
+    after_id = int(checkpoint.position)
+    total = 0
+    started = time.monotonic()
+    while True:
+        assessments = db.session.query(Assessment.id, Assessment.type, Assessment.answer_vector).filter(
+            Assessment.answer_vector.is_(None),
+            Assessment.id > after_id
+        ).order_by(Assessment.id).limit(chunk_size).all()
+        if not assessments:
+            break
+
+        vectors = load_answer_vectors(assessments)
+        db.session.execute(update(Assessment), [
+            {'id': assessment_id, 'answer_vector': answer_vector}
+            for assessment_id, answer_vector in vectors.items()
+        ])
+        if delete_rows:
+            db.session.execute(delete(Response).where(Response.assessment_id.in_(list(vectors))))
+
+        after_id = assessments[-1].id
+        JobCheckpoint.get('answers-pack').position = str(after_id)
+        db.session.commit()
+
+        total += len(vectors)
+        echo(f'Packed {total} assessments through {after_id}, '
+             f'{total / (time.monotonic() - started):.0f} assessments/s')
+
+    echo(f'Done: {total} assessments packed')
+    return total
@@ -0,0 +1,190 @@
+"""Population norms for premium category scores.
+
+Scores are reported to one decimal place, so each category keeps a cumulative
+histogram over the 1001 possible values (0.0-100.0). The histograms live in a
+memory-mapped file shared by every worker process: lookups read the mapped
+pages directly with no locking, and updates take an exclusive file lock.
+
+rebuild_norms scans without the lock. It first takes a snapshot of the counts
+and the newest report id, and counts only assessments reported up to that id.
+Then Norms.replace swaps in the new counts under the lock, adding whatever was
+recorded since the snapshot. Completions during a rebuild are therefore never
+blocked on it, nor lost or counted twice. The exception is a report committed
+in the instant between the snapshot and reading the newest id.
+"""
+import fcntl
+import logging
+import os
+from contextlib import contextmanager
+import numpy as np
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+BINS = 1001
+
+_instances = {}
+
+
+def _bin(percentage):
+    return min(max(int(round(percentage * 10)), 0), BINS - 1)
+
+
+class Norms:
+    """Cumulative per-category score counts backed by a memory-mapped file"""
+
+    def __init__(self, path, categories, min_sample=30):
+        self.path = path
+        self.categories = list(categories)
+        self.index = {category: c for c, category in enumerate(self.categories)}
+        self.min_sample = min_sample
+        self._counts = None
+
+    @contextmanager
+    def _lock(self):
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _map(self):
+        """The mapped counts, creating or resetting the file first if needed; the caller holds the lock"""
+        if self._counts is None:
+            shape = (len(self.categories), BINS)
+            size = shape[0] * shape[1] * np.dtype(np.int64).itemsize
+            if not os.path.exists(self.path) or os.path.getsize(self.path) != size:
+                if os.path.exists(self.path):
+                    logger.warning(f"Norms file {self.path} does not match the current categories, resetting it")
+                with open(self.path, 'wb') as f:
+                    f.truncate(size)
+            self._counts = np.memmap(self.path, dtype=np.int64, mode='r+', shape=shape)
+        return self._counts
+
+    @property
+    def counts(self):
+        """(categories x BINS) array; counts[c, b] = scores at or below bin b"""
+        if self._counts is None:
+            with self._lock():
+                self._map()
+        return self._counts
+
+    def sample_size(self, category):
+        return int(self.counts[self.index[category], -1])
+
+    def percentile_rank(self, category, percentage):
+        """Share of people (0-100) scoring strictly lower, or None without enough data"""
+        c = self.index.get(category)
+        if c is None:
+            return None
+        total = int(self.counts[c, -1])
+        if total < self.min_sample:
+            return None
+        b = _bin(percentage)
+        lower = int(self.counts[c, b - 1]) if b else 0
+        return round(lower / total * 100)
+
+    def percentile_ranks(self, category_scores):
+        """Map each scored category to its percentile rank where available"""
+        ranks = {}
+        for category, score in category_scores.items():
+            rank = self.percentile_rank(category, score['percentage'])
+            if rank is not None:
+                ranks[category] = rank
+        return ranks
+
+    def score_at_percentile(self, category, percentile):
+        """Smallest score reached by at least `percentile`% of people (binary search)"""
+        row = self.counts[self.index[category]]
+        total = int(row[-1])
+        if not total:
+            return None
+        return int(np.searchsorted(row, percentile / 100 * total, side='left')) / 10
+
+    def record(self, category_scores):
+        """Add one assessment's category scores to the population"""
+        with self._lock():
+            counts = self._map()
+            for category, score in category_scores.items():
+                c = self.index.get(category)
+                if c is not None:
+                    counts[c, _bin(score['percentage']):] += 1
+            counts.flush()
+
+    def snapshot(self):
+        """A copy of the counts, for replace(since=...)"""
+        with self._lock():
+            return np.array(self._map())
+
+    def replace(self, histograms, since=None):
+        """Overwrite all counts from per-bin (non-cumulative) histograms.
+
+        With `since` (a snapshot()), scores recorded after that snapshot are kept.
+        """
+        replacement = np.cumsum(histograms, axis=1)
+        with self._lock():
+            counts = self._map()
+            if since is not None:
+                replacement += counts - since
+            counts[:] = replacement
+            counts.flush()
+
+
+def open_norms(path, min_sample=30):
+    """Return the process-wide Norms instance for a file"""
+    if path not in _instances:
+        from app.assessment.scoring_engine import get_plan
+        _instances[path] = Norms(path, get_plan('premium').categories, min_sample)
+    return _instances[path]
+
+
+def get_norms():
+    """Return the norms configured for the current app"""
+    path = current_app.config['NORMS_FILE']
+    if not path:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        path = os.path.join(current_app.instance_path, 'norms.dat')
+    return open_norms(path, current_app.config['NORMS_MIN_SAMPLE'])
+
+
+def rebuild_norms(norms, chunk_size=5000, echo=print):
+    """Recompute the norms from every reported premium assessment"""
+    from sqlalchemy import func, select
+    from app import db
+    from app.models import Assessment, Report
+    from app.assessment.answers import load_answer_vectors, unpack_answers
+    from app.assessment.scoring_engine import get_plan
+
+    plan = get_plan('premium')
+    histograms = np.zeros((len(plan.categories), BINS), dtype=np.int64)
+    # Assessments reported after this point are recorded into the live counts, and kept by replace()
+    since = norms.snapshot()
+    last_report_id = db.session.query(func.max(Report.id)).scalar() or 0
+    reported = select(Report.id).where(Report.assessment_id == Assessment.id, Report.id <= last_report_id).exists()
+    after_id = total = 0
+    while True:
+        assessments = db.session.query(Assessment.id, Assessment.type, Assessment.answer_vector).filter(
+            Assessment.completed == True,
+            Assessment.type == 'premium',
+            Assessment.id > after_id,
+            reported
+        ).order_by(Assessment.id).limit(chunk_size).all()
+        if not assessments:
+            break
+
+        vectors = load_answer_vectors(assessments)
+        answers = np.stack([unpack_answers(vectors[assessment.id]) for assessment in assessments])
+        scores = plan.score(answers)
+        for c in range(len(plan.categories)):
+            answered = scores.question_counts[:, c] > 0
+            bins = np.clip(np.rint(np.round(scores.percentages[answered, c], 1) * 10), 0, BINS - 1).astype(np.int64)
+            histograms[c] += np.bincount(bins, minlength=BINS)
+
+        after_id = assessments[-1].id
+        total += len(assessments)
+        echo(f'Scored {total} premium assessments')
+
+    norms.replace(histograms, since=since)
+    echo(f'Done: norms rebuilt from {total} assessments')
+    return total
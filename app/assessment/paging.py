@@ -0,0 +1,40 @@
+"""Grouping of premium questions into pages for the paged questionnaire.
+
+PREMIUM_PAGE_SIZE selects the layout: '1' keeps the original one question per
+page flow, 'category' puts each category on its own page, and any other number
+splits the questions into blocks of that size.
+"""
+from functools import lru_cache
+from itertools import groupby
+from flask import current_app
+from app.assessment.premium_questions import PREMIUM_ASSESSMENT_QUESTIONS
+
+
+@lru_cache(maxsize=None)
+def get_pages(page_size):
+    """Split the premium questions into a tuple of pages (tuples of questions)"""
+    if page_size == 'category':
+        return tuple(tuple(questions) for _, questions in
+                     groupby(PREMIUM_ASSESSMENT_QUESTIONS, key=lambda q: q['category']))
+
+    size = int(page_size)
+    if size < 1:
+        raise ValueError(f'Invalid PREMIUM_PAGE_SIZE: {page_size}')
+    return tuple(tuple(PREMIUM_ASSESSMENT_QUESTIONS[i:i + size])
+                 for i in range(0, len(PREMIUM_ASSESSMENT_QUESTIONS), size))
+
+
+def premium_pages():
+    """Pages for the current app, or None when the one-question-per-page flow is used"""
+    page_size = str(current_app.config['PREMIUM_PAGE_SIZE'])
+    if page_size == '1':
+        return None
+    return get_pages(page_size)
+
+
+def page_number(pages, question_id):
+    """1-based number of the page holding a question"""
+    for number, questions in enumerate(pages, 1):
+        if any(q['id'] == question_id for q in questions):
+            return number
+    raise ValueError(f'Unknown question {question_id}')
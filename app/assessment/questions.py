@@ -0,0 +1,55 @@
+# Simple Assessment - 10 Questions
+# Single "spike factor" scale, answered on a 5-point Likert scale
+
+ASSESSMENT_QUESTIONS = [
+    {
+        'id': 1,
+        'question': 'I enjoy taking on challenging projects even when the outcome is uncertain.',
+        'type': 'likert'
+    },
+    {
+        'id': 2,
+        'question': 'I often volunteer for leadership roles in group settings.',
+        'type': 'likert'
+    },
+    {
+        'id': 3,
+        'question': 'I bounce back quickly from setbacks and failures.',
+        'type': 'likert'
+    },
+    {
+        'id': 4,
+        'question': 'I prefer to work on multiple projects simultaneously rather than one at a time.',
+        'type': 'likert'
+    },
+    {
+        'id': 5,
+        'question': 'I actively seek feedback to improve my performance.',
+        'type': 'likert'
+    },
+    {
+        'id': 6,
+        'question': 'I feel energized by competitive environments.',
+        'type': 'likert'
+    },
+    {
+        'id': 7,
+        'question': 'I am comfortable making decisions with incomplete information.',
+        'type': 'likert'
+    },
+    {
+        'id': 8,
+        'question': 'I enjoy networking and meeting new people in professional settings.',
+        'type': 'likert'
+    },
+    {
+        'id': 9,
+        'question': 'I often initiate new ideas and innovations in my work.',
+        'type': 'likert'
+    },
+    {
+        'id': 10,
+        'question': 'I maintain high performance even under tight deadlines.',
+        'type': 'likert'
+    }
+]
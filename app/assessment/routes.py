@@ -1,66 +1,20 @@
-from flask import render_template, redirect, url_for, flash, request, session
+from flask import render_template, redirect, url_for, flash, request, session, current_app
 from flask_login import login_required, current_user
 from datetime import datetime
 from app import db
 from app.assessment import bp
-from app.models import Assessment, Response, Report, Payment
-from app.assessment.scoring import calculate_spike_factor, generate_personality_insights
+from app.models import Assessment
+from app.jobs import enqueue
+from app.assessment.answers import (init_answer_storage, get_answers, save_answer, save_answers, next_question_id,
+                                    answered_count, is_fully_answered)
+from app.assessment.scoring_engine import get_plan, UNANSWERED
+from app.assessment.paging import premium_pages, page_number
+from app.payment.entitlements import premium_payment_id
+from app.query_stats import query_budget
+from app.reports.tasks import generate_report_for, report_job_key
+from app.assessment.questions import ASSESSMENT_QUESTIONS
 from app.assessment.premium_questions import PREMIUM_ASSESSMENT_QUESTIONS
 
-# Sample assessment questions
-ASSESSMENT_QUESTIONS = [
-    {
-        'id': 1,
-        'question': 'I enjoy taking on challenging projects even when the outcome is uncertain.',
-        'type': 'likert'
-    },
-    {
-        'id': 2,
-        'question': 'I often volunteer for leadership roles in group settings.',
-        'type': 'likert'
-    },
-    {
-        'id': 3,
-        'question': 'I bounce back quickly from setbacks and failures.',
-        'type': 'likert'
-    },
-    {
-        'id': 4,
-        'question': 'I prefer to work on multiple projects simultaneously rather than one at a time.',
-        'type': 'likert'
-    },
-    {
-        'id': 5,
-        'question': 'I actively seek feedback to improve my performance.',
-        'type': 'likert'
-    },
-    {
-        'id': 6,
-        'question': 'I feel energized by competitive environments.',
-        'type': 'likert'
-    },
-    {
-        'id': 7,
-        'question': 'I am comfortable making decisions with incomplete information.',
-        'type': 'likert'
-    },
-    {
-        'id': 8,
-        'question': 'I enjoy networking and meeting new people in professional settings.',
-        'type': 'likert'
-    },
-    {
-        'id': 9,
-        'question': 'I often initiate new ideas and innovations in my work.',
-        'type': 'likert'
-    },
-    {
-        'id': 10,
-        'question': 'I maintain high performance even under tight deadlines.',
-        'type': 'likert'
-    }
-]
-
 @bp.route('/simple')
 @login_required
 def simple():
@@ -85,9 +39,9 @@ def simple():
     ).first()
 
     if incomplete_assessment:
-        # Continue existing assessment
-        current_question = len(incomplete_assessment.responses.all()) + 1
-        if current_question > len(ASSESSMENT_QUESTIONS):
+        # Continue existing assessment at the first unanswered question
+        current_question = next_question_id(incomplete_assessment)
+        if current_question is None:
             # All questions answered, complete assessment
             return redirect(url_for('assessment.complete', assessment_id=incomplete_assessment.id))
         else:
@@ -95,6 +49,7 @@ def simple():
 
     # Start new assessment (user has no assessments yet)
     assessment = Assessment(user_id=current_user.id, type='simple')
+    init_answer_storage(assessment)
     db.session.add(assessment)
     db.session.commit()
     current_question = 1
@@ -130,12 +85,7 @@ def question(question_id):
                                  total_questions=len(ASSESSMENT_QUESTIONS))
 
         # Save response
-        response = Response(
-            assessment_id=assessment.id,
-            question_id=question_id,
-            answer=answer
-        )
-        db.session.add(response)
+        save_answer(assessment, question_id, answer)
         db.session.commit()
 
         # Check if this was the last question
@@ -163,47 +113,16 @@ def complete(assessment_id):
         report = assessment.reports.first()
         if report:
             return redirect(url_for('reports.view', report_id=report.id))
+    elif not is_fully_answered(assessment):
+        flash('Please answer every question before completing the assessment.')
+        return redirect(url_for('assessment.simple'))
 
     # Mark assessment as completed
     assessment.completed = True
     assessment.completed_at = datetime.utcnow()
 
     # Generate report
-    responses = assessment.responses.all()
-    spike_factor = calculate_spike_factor(responses)
-    insights = generate_personality_insights(spike_factor, responses)
-
-    # Create report content
-    report_content = f"""
-    <h2>Your Spike Factor Assessment Results</h2>
-    <div class="alert alert-info">
-        <h3>Spike Factor Score: {insights['spike_factor']}%</h3>
-        <h4>Category: {insights['category']}</h4>
-    </div>
-
-    <h3>Your Strengths:</h3>
-    <ul>
-    {''.join([f'<li>{strength}</li>' for strength in insights['strengths']])}
-    </ul>
-
-    <h3>Areas for Growth:</h3>
-    <ul>
-    {''.join([f'<li>{area}</li>' for area in insights['growth_areas']])}
-    </ul>
-
-    <h3>Recommendations:</h3>
-    <ul>
-    {''.join([f'<li>{rec}</li>' for rec in insights['recommendations']])}
-    </ul>
-    """
-
-    report = Report(
-        assessment_id=assessment.id,
-        content=report_content
-    )
-
-    db.session.add(report)
-    db.session.commit()
+    report = generate_report_for(assessment)
 
     return redirect(url_for('reports.view', report_id=report.id))
 
@@ -211,24 +130,18 @@ def complete(assessment_id):
 @login_required
 def premium():
     """Start or continue premium assessment"""
-    # Check if user has paid for premium assessment
-    if not current_user.has_premium_access():
+    # Check if user has paid for premium assessment, and get the payment to link to the assessment
+    payment_id = premium_payment_id(current_user.id)
+    if payment_id is None:
         flash('You need to purchase the premium assessment first.')
         return redirect(url_for('payment.checkout_premium'))
 
-    # Get any successful payment for linking to assessment
-    payment = Payment.query.filter_by(
-        user_id=current_user.id,
-        assessment_type='premium',
-        status='succeeded'
-    ).first()
-
     # Check if user has already completed premium assessment
     completed_assessment = Assessment.query.filter_by(
         user_id=current_user.id,
         type='premium',
         completed=True,
-        payment_id=payment.id
+        payment_id=payment_id
     ).first()
 
     if completed_assessment:
@@ -236,6 +149,8 @@ def premium():
         report = completed_assessment.reports.first()
         if report:
             return redirect(url_for('reports.view', report_id=report.id))
+        elif current_app.config['REPORT_QUEUE_ENABLED']:
+            return redirect(url_for('reports.generating', assessment_id=completed_assessment.id))
         else:
             return redirect(url_for('dashboard.index'))
 
@@ -244,31 +159,40 @@ def premium():
         user_id=current_user.id,
         type='premium',
         completed=False,
-        payment_id=payment.id
+        payment_id=payment_id
     ).first()
 
     if incomplete_assessment:
-        # Continue existing assessment
-        current_question = len(incomplete_assessment.responses.all()) + 1
-        if current_question > len(PREMIUM_ASSESSMENT_QUESTIONS):
+        # Continue existing assessment at the first unanswered question
+        current_question = next_question_id(incomplete_assessment)
+        if current_question is None:
             # All questions answered, complete assessment
             return redirect(url_for('assessment.premium_complete', assessment_id=incomplete_assessment.id))
         else:
-            return redirect(url_for('assessment.premium_question', question_id=current_question))
+            return redirect(premium_question_url(current_question))
 
     # Start new premium assessment
     assessment = Assessment(
         user_id=current_user.id,
         type='premium',
-        payment_id=payment.id
+        payment_id=payment_id
     )
+    init_answer_storage(assessment)
     db.session.add(assessment)
     db.session.commit()
 
-    return redirect(url_for('assessment.premium_question', question_id=1))
+    return redirect(premium_question_url(1))
+
+def premium_question_url(question_id):
+    """URL of a premium question, or of the page holding it in paged mode"""
+    pages = premium_pages()
+    if pages:
+        return url_for('assessment.premium_page', page_num=page_number(pages, question_id))
+    return url_for('assessment.premium_question', question_id=question_id)
 
 @bp.route('/premium/question/<int:question_id>', methods=['GET', 'POST'])
 @login_required
+@query_budget(6)
 def premium_question(question_id):
     """Handle premium assessment questions"""
     if question_id < 1 or question_id > len(PREMIUM_ASSESSMENT_QUESTIONS):
@@ -276,23 +200,17 @@ def premium_question(question_id):
         return redirect(url_for('assessment.premium'))
 
     # Verify user has access to premium assessment
-    if not current_user.has_premium_access():
+    payment_id = premium_payment_id(current_user.id)
+    if payment_id is None:
         flash('You need to purchase the premium assessment first.')
         return redirect(url_for('payment.checkout_premium'))
 
-    # Get any successful payment for linking to assessment
-    payment = Payment.query.filter_by(
-        user_id=current_user.id,
-        assessment_type='premium',
-        status='succeeded'
-    ).first()
-
     # Get current assessment
     assessment = Assessment.query.filter_by(
         user_id=current_user.id,
         type='premium',
         completed=False,
-        payment_id=payment.id
+        payment_id=payment_id
     ).first()
 
     if not assessment:
@@ -307,27 +225,11 @@ def premium_question(question_id):
             return render_template('assessment/premium_question.html',
                                  question=question_data,
                                  question_num=question_id,
+                                 answered=answered_count(assessment),
                                  total_questions=len(PREMIUM_ASSESSMENT_QUESTIONS))
 
-        # Check if response already exists for this question (premium user might be revisiting)
-        existing_response = Response.query.filter_by(
-            assessment_id=assessment.id,
-            question_id=question_id
-        ).first()
-
-        if existing_response:
-            # Update existing response for premium users (allow response modification)
-            existing_response.answer = answer
-            existing_response.created_at = datetime.utcnow()
-        else:
-            # Save new response
-            response = Response(
-                assessment_id=assessment.id,
-                question_id=question_id,
-                answer=answer
-            )
-            db.session.add(response)
-
+        # Save response, replacing any earlier answer (premium user might be revisiting)
+        save_answer(assessment, question_id, answer)
         db.session.commit()
 
         # Check if this was the last question
@@ -339,6 +241,73 @@ def premium_question(question_id):
     return render_template('assessment/premium_question.html',
                          question=question_data,
                          question_num=question_id,
+                         answered=answered_count(assessment),
+                         total_questions=len(PREMIUM_ASSESSMENT_QUESTIONS))
+
+@bp.route('/premium/page/<int:page_num>', methods=['GET', 'POST'])
+@login_required
+@query_budget(6)
+def premium_page(page_num):
+    """Handle a page of premium assessment questions (paged mode)"""
+    pages = premium_pages()
+    if not pages:
+        return redirect(url_for('assessment.premium'))
+
+    if page_num < 1 or page_num > len(pages):
+        flash('Invalid page number')
+        return redirect(url_for('assessment.premium'))
+
+    # Verify user has access to premium assessment
+    payment_id = premium_payment_id(current_user.id)
+    if payment_id is None:
+        flash('You need to purchase the premium assessment first.')
+        return redirect(url_for('payment.checkout_premium'))
+
+    assessment = Assessment.query.filter_by(
+        user_id=current_user.id,
+        type='premium',
+        completed=False,
+        payment_id=payment_id
+    ).first()
+
+    if not assessment:
+        return redirect(url_for('assessment.premium'))
+
+    questions = pages[page_num - 1]
+
+    if request.method == 'POST':
+        answers = {q['id']: request.form.get(f"answer_{q['id']}") for q in questions}
+        if not all(answers.values()):
+            flash('Please answer every question on this page')
+            return render_template('assessment/premium_page.html',
+                                 questions=questions,
+                                 selected=answers,
+                                 page_num=page_num,
+                                 total_pages=len(pages),
+                                 answered=answered_count(assessment),
+                                 total_questions=len(PREMIUM_ASSESSMENT_QUESTIONS))
+
+        # Save the whole page, replacing any earlier answers, in one flush and commit
+        save_answers(assessment, answers)
+        db.session.commit()
+
+        if page_num >= len(pages):
+            return redirect(url_for('assessment.premium_complete', assessment_id=assessment.id))
+        else:
+            return redirect(url_for('assessment.premium_page', page_num=page_num + 1))
+
+    # Pre-select earlier answers when a user revisits a page
+    plan = get_plan('premium')
+    all_answers = get_answers(assessment)
+    selected = {q['id']: str(all_answers[plan.index[q['id']]]) for q in questions
+                if all_answers[plan.index[q['id']]] != UNANSWERED}
+
+    return render_template('assessment/premium_page.html',
+                         questions=questions,
+                         selected=selected,
+                         page_num=page_num,
+                         total_pages=len(pages),
+                         answered=answered_count(assessment),
                          total_questions=len(PREMIUM_ASSESSMENT_QUESTIONS))
 
 @bp.route('/premium/complete/<int:assessment_id>')
@@ -356,22 +325,24 @@ def premium_complete(assessment_id):
         report = assessment.reports.first()
         if report:
             return redirect(url_for('reports.view', report_id=report.id))
+        if current_app.config['REPORT_QUEUE_ENABLED']:
+            # Report is still being generated in the background
+            return redirect(url_for('reports.generating', assessment_id=assessment.id))
+    elif not is_fully_answered(assessment):
+        flash('Please answer every question before completing the assessment.')
+        return redirect(url_for('assessment.premium'))
 
     # Mark assessment as completed
     assessment.completed = True
     assessment.completed_at = datetime.utcnow()
 
-    # Generate comprehensive report
-    responses = assessment.responses.all()
-    from app.assessment.premium_scoring import generate_comprehensive_report
-    report_content = generate_comprehensive_report(responses)
-
-    report = Report(
-        assessment_id=assessment.id,
-        content=report_content
-    )
+    if current_app.config['REPORT_QUEUE_ENABLED']:
+        # Hand the comprehensive report to a background worker and return immediately
+        enqueue('generate_report', {'assessment_id': assessment.id}, key=report_job_key(assessment.id))
+        db.session.commit()
+        return redirect(url_for('reports.generating', assessment_id=assessment.id))
 
-    db.session.add(report)
-    db.session.commit()
+    # Generate comprehensive report, ranking scores against the population norms
+    report = generate_report_for(assessment)
 
     return redirect(url_for('reports.view', report_id=report.id))
\ No newline at end of file
@@ -1,32 +1,13 @@
-def calculate_spike_factor(responses):
-    """Calculate spike factor based on assessment responses"""
+from app.assessment.scoring_engine import get_plan
 
-    # Sample scoring algorithm - can be enhanced based on psychological models
-    total_score = 0
-    max_score = len(responses) * 5  # Assuming 5-point scale
+def spike_factor_from_answers(answers):
+    """Calculate spike factor from an answer vector"""
+    # Answers are mapped to a 1-5 Likert score and averaged as a percentage
+    scores = get_plan('simple').category_scores(answers)
+    if 'spike_factor' not in scores:
+        return 0.0
 
-    for response in responses:
-        # Convert text response to numerical score
-        answer = response.answer.lower()
-        if 'strongly agree' in answer or answer == '5':
-            score = 5
-        elif 'agree' in answer or answer == '4':
-            score = 4
-        elif 'neutral' in answer or answer == '3':
-            score = 3
-        elif 'disagree' in answer or answer == '2':
-            score = 2
-        elif 'strongly disagree' in answer or answer == '1':
-            score = 1
-        else:
-            score = 3  # Default neutral
-
-        total_score += score
-
-    # Calculate percentage
-    spike_factor = (total_score / max_score) * 100
-
-    return round(spike_factor, 1)
+    return scores['spike_factor']['percentage']
 
 def generate_personality_insights(spike_factor, responses):
     """Generate personality insights based on spike factor"""
@@ -89,4 +70,10 @@ def generate_personality_insights(spike_factor, responses):
             'Seek supportive environments'
         ]
 
-    return insights
\ No newline at end of file
+    return insights
+
+def build_simple_report(answers):
+    """Build the structured simple assessment report for an answer vector"""
+    spike_factor = spike_factor_from_answers(answers)
+    insights = generate_personality_insights(spike_factor, answers)
+    return dict(insights, instrument='simple')
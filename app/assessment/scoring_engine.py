@@ -0,0 +1,158 @@
+"""Vectorized scoring for the simple and premium assessments.
+
+Each instrument is compiled once into a ScoringPlan: a (questions x categories)
+weight matrix with reverse-scored items folded in as a -1 weight plus a constant
+offset, so an (N x questions) array of Likert answers is scored in one pass.
+Answers are integers 1-5, with 0 marking an unanswered question.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from app.assessment.questions import ASSESSMENT_QUESTIONS
+from app.assessment.premium_questions import PREMIUM_ASSESSMENT_QUESTIONS
+
+LIKERT_MIN = 1
+LIKERT_MAX = 5
+UNANSWERED = 0
+
+# Text answers used by the simple assessment form
+ANSWER_LABELS = {
+    'strongly disagree': 1,
+    'disagree': 2,
+    'neutral': 3,
+    'agree': 4,
+    'strongly agree': 5,
+}
+
+BatchScores = namedtuple('BatchScores', ['raw_scores', 'question_counts', 'percentages', 'overall'])
+
+
+def parse_answer(answer):
+    """Convert a stored answer ('4' or 'Agree') to its Likert value"""
+    text = str(answer).strip().lower()
+    if text in ANSWER_LABELS:
+        return ANSWER_LABELS[text]
+    if text.isdigit() and LIKERT_MIN <= int(text) <= LIKERT_MAX:
+        return int(text)
+    return 3  # Default neutral
+
+
+class ScoringPlan:
+    """Compiled category-weight matrix for one instrument"""
+
+    def __init__(self, instrument, questions, default_category=None):
+        self.instrument = instrument
+        self.question_ids = [q['id'] for q in questions]
+        self.index = {question_id: i for i, question_id in enumerate(self.question_ids)}
+
+        self.categories = []
+        for q in questions:
+            category = q.get('category', default_category)
+            if category not in self.categories:
+                self.categories.append(category)
+
+        shape = (len(questions), len(self.categories))
+        self.weights = np.zeros(shape)
+        self.offsets = np.zeros(shape)
+        self.membership = np.zeros(shape)
+        for i, q in enumerate(questions):
+            c = self.categories.index(q.get('category', default_category))
+            self.membership[i, c] = 1
+            if q.get('reverse_scored', False):
+                # 6 - answer, applied only when the question was answered
+                self.weights[i, c] = -1
+                self.offsets[i, c] = LIKERT_MAX + 1
+            else:
+                self.weights[i, c] = 1
+
+    @property
+    def question_count(self):
+        return len(self.question_ids)
+
+    def empty_answers(self, rows=None):
+        """Return an unanswered answer vector (or matrix of `rows` vectors)"""
+        shape = self.question_count if rows is None else (rows, self.question_count)
+        return np.full(shape, UNANSWERED, dtype=np.uint8)
+
+    def answers_from_responses(self, responses):
+        """Build an answer vector from Response-like objects"""
+        answers = self.empty_answers()
+        for response in responses:
+            i = self.index.get(response.question_id)
+            if i is not None:
+                answers[i] = parse_answer(response.answer)
+        return answers
+
+    def validate(self, answers):
+        """Coerce answers to a 2-D integer array, raising ValueError if malformed"""
+        if isinstance(answers, (list, tuple)) and any(isinstance(row, (list, tuple)) for row in answers):
+            # A ragged batch would otherwise fail inside numpy with its own message
+            for n, row in enumerate(answers):
+                if not isinstance(row, (list, tuple)):
+                    raise ValueError(f'answers row {n} is not a list of {self.question_count} values')
+                if len(row) != self.question_count:
+                    raise ValueError(f'answers row {n} has {len(row)} values, expected {self.question_count}')
+        try:
+            answers = np.asarray(answers)
+        except (ValueError, TypeError):
+            raise ValueError('Each answer must be a single integer')
+        if answers.ndim == 1:
+            answers = answers[np.newaxis, :]
+        if answers.ndim != 2 or answers.shape[1] != self.question_count:
+            raise ValueError(f'Expected {self.question_count} answers per row for {self.instrument} assessment')
+        if not np.issubdtype(answers.dtype, np.integer):
+            raise ValueError('Answers must be integers')
+        if answers.size and (answers.min() < UNANSWERED or answers.max() > LIKERT_MAX):
+            raise ValueError(f'Answers must be between {LIKERT_MIN} and {LIKERT_MAX}, or {UNANSWERED} if unanswered')
+        return answers
+
+    def score(self, answers):
+        """Score an (N x questions) answer array in a single vectorized pass"""
+        answers = self.validate(answers).astype(np.float64)
+        answered = (answers != UNANSWERED).astype(np.float64)
+
+        raw_scores = answers @ self.weights + answered @ self.offsets
+        question_counts = answered @ self.membership
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percentages = np.where(question_counts > 0,
+                                   raw_scores / (question_counts * LIKERT_MAX) * 100,
+                                   np.nan)
+            # Overall score is the mean over the categories that were answered
+            scored_categories = (question_counts > 0).sum(axis=1)
+            overall = np.where(scored_categories > 0,
+                               np.nansum(percentages, axis=1) / scored_categories,
+                               np.nan)
+
+        return BatchScores(raw_scores, question_counts, percentages, overall)
+
+    def category_scores(self, answers):
+        """Score a single answer vector into the per-category dict used by reports"""
+        batch = self.score(answers)
+        scores = {}
+        for c, category in enumerate(self.categories):
+            count = int(batch.question_counts[0, c])
+            if not count:
+                continue
+            raw_score = int(batch.raw_scores[0, c])
+            scores[category] = {
+                'raw_score': raw_score,
+                'percentage': round((raw_score / (count * LIKERT_MAX)) * 100, 1),
+                'max_possible': count * LIKERT_MAX,
+                'question_count': count
+            }
+        return scores
+
+
+PLANS = {
+    'simple': ScoringPlan('simple', ASSESSMENT_QUESTIONS, default_category='spike_factor'),
+    'premium': ScoringPlan('premium', PREMIUM_ASSESSMENT_QUESTIONS),
+}
+
+
+def get_plan(instrument):
+    """Return the compiled scoring plan for an assessment type"""
+    try:
+        return PLANS[instrument]
+    except KeyError:
+        raise ValueError(f'Unknown assessment type: {instrument}')
@@ -0,0 +1,208 @@
+import click
+
+
+def register_commands(app):
+    @app.cli.group()
+    def reports():
+        """Report maintenance commands."""
+
+    @reports.command('regenerate')
+    @click.option('--chunk-size', default=500, show_default=True, help='Assessments loaded and committed per chunk.')
+    @click.option('--workers', default=None, type=int, help='Scoring processes (default: CPU count, 1 runs inline).')
+    @click.option('--type', 'assessment_type', type=click.Choice(['simple', 'premium']), help='Only regenerate one assessment type.')
+    @click.option('--keep-previous', is_flag=True, help='Keep superseded reports instead of replacing them.')
+    @click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start from the beginning.')
+    def regenerate(chunk_size, workers, assessment_type, keep_previous, restart):
+        """Rescore completed assessments and regenerate their reports (resumable)."""
+        from app.reports.regeneration import regenerate_reports, ScoringVersionError
+        try:
+            regenerate_reports(chunk_size=chunk_size, workers=workers, assessment_type=assessment_type,
+                               keep_previous=keep_previous, restart=restart, echo=click.echo)
+        except ScoringVersionError as e:
+            raise click.ClickException(str(e))
+
+    @app.cli.group()
+    def answers():
+        """Answer storage commands."""
+
+    @answers.command('pack')
+    @click.option('--chunk-size', default=1000, show_default=True, help='Assessments converted and committed per chunk.')
+    @click.option('--delete-rows', is_flag=True, help='Delete the Response rows once an assessment is packed.')
+    @click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start from the beginning.')
+    def pack(chunk_size, delete_rows, restart):
+        """Convert Response rows into packed per-assessment answer vectors (resumable)."""
+        from app.assessment.answers import pack_existing_answers
+        pack_existing_answers(chunk_size=chunk_size, delete_rows=delete_rows, restart=restart, echo=click.echo)
+
+    @app.cli.group()
+    def norms():
+        """Population norms commands."""
+
+    @norms.command('rebuild')
+    @click.option('--chunk-size', default=5000, show_default=True, help='Assessments scored per chunk.')
+    def rebuild(chunk_size):
+        """Recompute premium score norms from all completed assessments."""
+        from app.assessment.norms import get_norms, rebuild_norms
+        rebuild_norms(get_norms(), chunk_size=chunk_size, echo=click.echo)
+
+    @app.cli.group()
+    def jobs():
+        """Background job commands."""
+
+    @jobs.command('work')
+    @click.option('--processes', default=1, show_default=True, help='Worker processes to run.')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to sleep when the queue is empty.')
+    @click.option('--visibility-timeout', default=None, type=int, help='Seconds a claimed job stays hidden (default: JOB_VISIBILITY_TIMEOUT).')
+    @click.option('--kind', 'kinds', multiple=True, help='Only process these job kinds.')
+    @click.option('--once', is_flag=True, help='Exit when the queue is empty.')
+    def work(processes, poll_interval, visibility_timeout, kinds, once):
+        """Process background jobs."""
+        import multiprocessing
+        from app import db
+        from app.jobs import work as run_worker
+
+        def run():
+            # Connections must not be shared with the parent process
+            db.engine.dispose(close=False)
+            run_worker(poll_interval, visibility_timeout, kinds or None, once)
+
+        if processes == 1:
+            run_worker(poll_interval, visibility_timeout, kinds or None, once)
+            return
+
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=run) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    @app.cli.group()
+    def webhooks():
+        """Stripe webhook inbox commands."""
+
+    @webhooks.command('work')
+    @click.option('--batch-size', default=100, show_default=True, help='Events claimed and applied per transaction.')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to sleep when the inbox is empty.')
+    @click.option('--visibility-timeout', default=None, type=int, help='Seconds a claimed batch stays hidden (default: JOB_VISIBILITY_TIMEOUT).')
+    @click.option('--once', is_flag=True, help='Exit when the inbox is empty.')
+    def webhooks_work(batch_size, poll_interval, visibility_timeout, once):
+        """Apply stored Stripe webhook events to payments and entitlements."""
+        from app.payment.webhooks import work as run_worker
+        run_worker(batch_size, poll_interval, visibility_timeout, once)
+
+    @app.cli.group('stripe')
+    def stripe_commands():
+        """Stripe API commands."""
+
+    @stripe_commands.command('fake-server')
+    @click.option('--host', default='127.0.0.1', show_default=True)
+    @click.option('--port', default=12111, show_default=True)
+    @click.option('--webhook-url', default='http://127.0.0.1:5000/payment/webhook', show_default=True, help='Where to deliver payment_intent.* events.')
+    @click.option('--latency-ms', default=0, show_default=True, help='Delay added to every API response.')
+    def fake_server(host, port, webhook_url, latency_ms):
+        """Serve a local fake of the Stripe API for offline checkout load tests."""
+        from werkzeug.serving import run_simple
+        from app.payment.fake_stripe import create_fake_stripe
+        fake = create_fake_stripe(webhook_url, app.config['STRIPE_WEBHOOK_SECRET'], latency_ms / 1000)
+        click.echo(f'Fake Stripe API on http://{host}:{port} (set STRIPE_API_BASE), webhooks to {webhook_url}')
+        run_simple(host, port, fake, threaded=True)
+
+    @app.cli.group()
+    def payments():
+        """Payment maintenance commands."""
+
+    @payments.command('reconcile')
+    @click.option('--older-than', default=30, show_default=True, help='Only payments pending for more than this many minutes.')
+    @click.option('--abandon-after', default=24, show_default=True, help='Hours after which an unpaid checkout is marked failed.')
+    @click.option('--batch-size', default=200, show_default=True, help='Payments checked and committed per page.')
+    @click.option('--workers', default=None, type=int, help='Concurrent Stripe requests (default: STRIPE_POOL_SIZE).')
+    @click.option('--limit', default=None, type=int, help='Stop after checking this many payments.')
+    def reconcile_payments(older_than, abandon_after, batch_size, workers, limit):
+        """Check stale pending payments against Stripe and apply their status."""
+        from app.payment.reconcile import reconcile_pending_payments
+        reconcile_pending_payments(older_than * 60, abandon_after * 3600, batch_size,
+                                   workers or app.config['STRIPE_POOL_SIZE'], limit, echo=click.echo)
+
+    @app.cli.group()
+    def queries():
+        """Database query commands."""
+
+    @queries.command('check-plans')
+    def check_plans():
+        """EXPLAIN the hot queries and fail if any of them scans a whole table."""
+        from app.query_plans import check_plans as run_checks
+        failures = run_checks(echo=click.echo)
+        if failures is None:
+            return
+        if failures:
+            raise click.ClickException(f'{len(failures)} hot queries fall back to a full table scan')
+        click.echo('All hot queries use an index')
+
+    @app.cli.group()
+    def stats():
+        """Admin statistics commands."""
+
+    @stats.command('reconcile')
+    def reconcile():
+        """Recompute the admin dashboard counters from the tables."""
+        from app.stats import reconcile_counters
+        reconcile_counters(echo=click.echo)
+
+    @app.cli.group()
+    def metrics():
+        """Analytics rollup commands."""
+
+    @metrics.command('rollup')
+    def rollup():
+        """Update the daily analytics rollups from the watermark (run from cron)."""
+        from app.admin.metrics import rollup_daily_metrics
+        rollup_daily_metrics(echo=click.echo)
+
+    @metrics.command('backfill')
+    @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to recompute (default: earliest signup).')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Day after the last day to recompute (default: tomorrow).')
+    @click.option('--chunk-days', default=30, show_default=True, help='Days recomputed and committed per chunk.')
+    def backfill(since, until, chunk_days):
+        """Recompute the daily analytics rollups for a range of days."""
+        from app.admin.metrics import backfill_daily_metrics
+        backfill_daily_metrics(since.date() if since else None, until.date() if until else None,
+                               chunk_days=chunk_days, echo=click.echo)
+
+    @app.cli.group()
+    def export():
+        """Research export commands."""
+
+    @export.command('assessments')
+    @click.option('--type', 'assessment_type', type=click.Choice(['simple', 'premium']), default='premium', show_default=True, help='Assessment type to export.')
+    @click.option('--format', 'export_format', type=click.Choice(['csv', 'parquet']), default='csv', show_default=True, help='Output format (parquet requires pyarrow).')
+    @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']), help='Only assessments completed at or after this time.')
+    @click.option('--batch-size', default=None, type=int, help='Assessments read and scored per batch (default: EXPORT_BATCH_SIZE).')
+    @click.option('--output', '-o', default='-', show_default=True, help='File to write, - for stdout.')
+    def export_assessments(assessment_type, export_format, since, batch_size, output):
+        """Export completed assessments as one wide row each: answers plus category scores."""
+        from app.admin.export import parquet_available, stream_export
+        from app.replica import use_replica
+        if export_format == 'parquet' and not parquet_available():
+            raise click.ClickException('Parquet export requires pyarrow (pip install pyarrow).')
+
+        batch_size = batch_size or app.config['EXPORT_BATCH_SIZE']
+        with use_replica(), click.open_file(output, 'w' if export_format == 'csv' else 'wb') as f:
+            for chunk in stream_export(assessment_type, export_format, since, batch_size):
+                f.write(chunk)
+
+    @app.cli.group()
+    def sqlite():
+        """SQLite tuning commands."""
+
+    @sqlite.command('bench')
+    @click.option('--workers', default=4, show_default=True, help='Concurrent worker processes.')
+    @click.option('--commits', default=200, show_default=True, help='Answers committed by each worker.')
+    @click.option('--write-lock', is_flag=True, help='Also measure the profile with SQLITE_WRITE_LOCK.')
+    def bench(workers, commits, write_lock):
+        """Compare answer-commit throughput on a scratch database without and with the SQLite profile."""
+        from app.sqlite_profile import benchmark_answer_commits
+        benchmark_answer_commits(workers, commits, profile=False, echo=click.echo)
+        benchmark_answer_commits(workers, commits, profile=True, echo=click.echo)
+        if write_lock:
+            benchmark_answer_commits(workers, commits, profile=True, write_lock=True, echo=click.echo)
@@ -1,21 +1,48 @@
-from flask import render_template
+from flask import render_template, request, current_app
 from flask_login import login_required, current_user
+from sqlalchemy import func, case
+from sqlalchemy.orm import contains_eager, load_only
+from app import db
 from app.dashboard import bp
 from app.models import Assessment, Report
+from app.pagination import keyset_paginate
+from app.query_stats import query_budget
 
 @bp.route('/')
 @bp.route('/index')
 @login_required
+@query_budget(4)
 def index():
-    assessments = current_user.assessments.order_by(Assessment.created_at.desc()).all()
-    return render_template('dashboard/index.html', title='Dashboard', assessments=assessments)
+    # Totals for the stat cards in one aggregate query each, instead of counting loaded rows
+    total, completed = db.session.query(
+        func.count(Assessment.id),
+        func.count(case((Assessment.completed == True, 1)))
+    ).filter(Assessment.user_id == current_user.id).one()
+    report_count = current_user.reports.count()
+
+    # Summary columns only, with each assessment's first report id from a correlated subquery
+    first_report_id = db.session.query(func.min(Report.id)).filter(
+        Report.assessment_id == Assessment.id
+    ).correlate(Assessment).scalar_subquery()
+    query = db.session.query(Assessment, first_report_id).options(load_only(
+        Assessment.id, Assessment.type, Assessment.completed, Assessment.created_at, Assessment.completed_at
+    )).filter(Assessment.user_id == current_user.id)
+    page = keyset_paginate(query, Assessment.created_at, Assessment.id,
+                           current_app.config['ASSESSMENTS_PER_PAGE'], request.args.get('cursor'),
+                           key=lambda row: (row[0].created_at, row[0].id))
+
+    return render_template('dashboard/index.html', title='Dashboard', assessments=page.items, page=page,
+                           total_assessments=total, completed_assessments=completed, report_count=report_count)
 
 @bp.route('/reports')
 @login_required
+@query_budget(2)
 def reports():
-    user_assessments = current_user.assessments.all()
-    reports = []
-    for assessment in user_assessments:
-        reports.extend(assessment.reports.all())
-    reports.sort(key=lambda x: x.generated_at, reverse=True)
-    return render_template('dashboard/reports.html', title='My Reports', reports=reports)
\ No newline at end of file
+    # One joined query for the page: report summary columns plus the assessment type
+    query = current_user.reports.options(
+        load_only(Report.id, Report.assessment_id, Report.overall_score, Report.category, Report.generated_at),
+        contains_eager(Report.assessment).load_only(Assessment.id, Assessment.type)
+    )
+    page = keyset_paginate(query, Report.generated_at, Report.id,
+                           current_app.config['REPORTS_PER_PAGE'], request.args.get('cursor'))
+    return render_template('dashboard/reports.html', title='My Reports', reports=page.items, page=page)
@@ -0,0 +1,113 @@
+"""Cached identities for signed-in users.
+
+Flask-Login's user_loader returns an Identity built from a per-process TTL
+cache of the user's id, email, verified and premium flags, so most
+authenticated requests (every premium question POST, for one) do not query
+the user table at all. Other User attributes and methods load the full ORM
+User on first use. Writes must go through `identity.user`; the cached fields
+are read-only.
+
+Mapper hooks drop a user from this process's cache when their email,
+password, premium flag or verification changes, or when they are deleted.
+Other processes see the change within IDENTITY_CACHE_TTL seconds.
+"""
+from collections import namedtuple
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+from app import db
+from app.cache import TTLCache
+from app.models import User, Report, Assessment
+
+IdentityRecord = namedtuple('IdentityRecord', ['id', 'email', 'verified', 'is_premium'])
+
+# Changes to these columns invalidate a cached identity
+IDENTITY_FIELDS = ['email', 'password_hash', 'verified', 'is_premium']
+
+_cache = None
+_registered = False
+
+
+def get_identity_cache():
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(current_app.config['IDENTITY_CACHE_SIZE'],
+                          current_app.config['IDENTITY_CACHE_TTL'])
+    return _cache
+
+
+class Identity(UserMixin):
+    """The signed-in user's cached fields; anything else comes from the ORM User, loaded on demand"""
+
+    def __init__(self, record):
+        self._record = record
+        self._user = None
+
+    id = property(lambda self: self._record.id)
+    email = property(lambda self: self._record.email)
+    verified = property(lambda self: self._record.verified)
+    is_premium = property(lambda self: self._record.is_premium)
+
+    @property
+    def user(self):
+        """The full User row, loaded once per request"""
+        if self._user is None:
+            self._user = db.session.get(User, self.id)
+        return self._user
+
+    @property
+    def reports(self):
+        """Get all reports for this user through their assessments"""
+        return db.session.query(Report).join(Report.assessment).filter(Assessment.user_id == self.id)
+
+    def has_premium_access(self):
+        from app.payment.entitlements import premium_payment_id
+        return premium_payment_id(self.id) is not None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __repr__(self):
+        return f'<Identity {self.email}>'
+
+
+def load_identity(user_id):
+    """Identity for a user id, or None if there is no such user"""
+    cache = get_identity_cache()
+    record = cache.get(user_id)
+    if record is None:
+        row = db.session.query(User.id, User.email, User.verified, User.is_premium).filter(
+            User.id == user_id
+        ).first()
+        if row is None:
+            return None
+        record = IdentityRecord(*row)
+        cache.set(user_id, record)
+    return Identity(record)
+
+
+def invalidate_identity(user_id):
+    if _cache is not None:
+        _cache.pop(user_id)
+
+
+def _user_updated(mapper, connection, target):
+    if any(get_history(target, field).has_changes() for field in IDENTITY_FIELDS):
+        invalidate_identity(target.id)
+
+
+def _user_deleted(mapper, connection, target):
+    invalidate_identity(target.id)
+
+
+def init_identity_cache():
+    """Register the cache invalidation hooks on User (once per process)"""
+    global _registered
+    if _registered:
+        return
+    event.listen(User, 'after_update', _user_updated)
+    event.listen(User, 'after_delete', _user_deleted)
+    _registered = True
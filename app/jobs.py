@@ -0,0 +1,140 @@
+"""Database-backed background job queue.
+
+Jobs are rows in the `job` table. A worker claims a job with a compare-and-set
+UPDATE that marks it running and hides it until `run_after` (the visibility
+timeout); if the worker dies, the job becomes visible again and is retried.
+Failed jobs are retried with exponential backoff up to `max_attempts`, and a job
+whose worker died during its last attempt is marked failed rather than reclaimed.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update, or_
+from app import db
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function(payload) as the handler for a job kind"""
+    def decorator(f):
+        HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+def enqueue(kind, payload, key=None, delay=0):
+    """Add a job to the current transaction; the caller commits.
+
+    Jobs with a `key` are enqueued at most once.
+    """
+    if key is not None:
+        existing = Job.query.filter_by(key=key).first()
+        if existing is not None:
+            return existing
+
+    job = Job(
+        kind=kind,
+        key=key,
+        payload=payload,
+        max_attempts=current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    return job
+
+
+def claim_next(worker_id, visibility_timeout, kinds=None):
+    """Claim the next visible job, or return None if there is nothing to do"""
+    now = datetime.utcnow()
+    query = Job.query.filter(
+        or_(Job.status == 'queued', Job.status == 'running'),
+        Job.run_after <= now
+    )
+    if kinds:
+        query = query.filter(Job.kind.in_(kinds))
+    candidates = query.order_by(Job.run_after, Job.id).limit(10).all()
+
+    for job in candidates:
+        if job.status == 'running' and job.attempts >= job.max_attempts:
+            # Its worker died during the last attempt; a job that kills its worker is not retried forever
+            result = db.session.execute(
+                update(Job)
+                .where(Job.id == job.id, Job.status == job.status, Job.run_after == job.run_after)
+                .values(status='failed', last_error='Worker stopped during the final attempt', updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                logger.error(f"Job {job.id} ({job.kind}) failed permanently: its worker stopped during attempt {job.attempts}")
+            continue
+
+        # Only one worker can move the job from this exact (status, run_after) state
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == job.status, Job.run_after == job.run_after)
+            .values(status='running',
+                    run_after=now + timedelta(seconds=visibility_timeout),
+                    attempts=Job.attempts + 1,
+                    locked_by=worker_id,
+                    updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            db.session.refresh(job)
+            return job
+    db.session.rollback()
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and record success, retry or failure"""
+    handler = HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job kind {job.kind}')
+        handler(job.payload)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.last_error = str(e)
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            logger.error(f"Job {job.id} ({job.kind}) failed permanently after {job.attempts} attempts: {e}", exc_info=True)
+        else:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+            logger.warning(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed, retrying: {e}")
+        db.session.commit()
+        return False
+
+    job = db.session.get(Job, job.id)
+    job.status = 'done'
+    job.last_error = None
+    db.session.commit()
+    logger.info(f"Job {job.id} ({job.kind}) done")
+    return True
+
+
+def work(poll_interval=1.0, visibility_timeout=None, kinds=None, once=False):
+    """Process jobs until interrupted (or until the queue is empty with once=True)"""
+    visibility_timeout = visibility_timeout or current_app.config['JOB_VISIBILITY_TIMEOUT']
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    logger.info(f"Job worker {worker_id} started")
+    processed = 0
+    while True:
+        job = claim_next(worker_id, visibility_timeout, kinds)
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
@@ -0,0 +1,27 @@
+"""Long-poll support for the status endpoints.
+
+A long-poll keeps its request open while it waits. That is only affordable
+when the server handles requests on threads or greenlets: gunicorn's gthread
+or gevent workers (gthread is the default in gunicorn.conf.py), or the
+threaded dev server. Under a sync worker a waiting poll would block the whole
+worker process. long_poll_wait therefore returns 0 there, and the pages fall
+back to plain polling.
+"""
+import logging
+from flask import request
+
+logger = logging.getLogger(__name__)
+
+_warned = False
+
+
+def long_poll_wait(maximum):
+    """Seconds this request may wait: ?wait= capped at `maximum`, or 0 on a single-threaded server"""
+    global _warned
+    wait = min(max(request.args.get('wait', 0, type=float), 0), maximum)
+    if wait and not request.environ.get('wsgi.multithread'):
+        if not _warned:
+            logger.warning("Long-polls disabled on a single-threaded server; run gunicorn with the gthread or gevent worker class")
+            _warned = True
+        return 0
+    return wait
@@ -15,14 +15,17 @@ class User(UserMixin, db.Model):
     reset_token = db.Column(db.String(100), unique=True)
     reset_token_expiry = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index('ix_user_created_at', 'created_at'),
+    )
+
     # Relationships
     assessments = db.relationship('Assessment', backref='user', lazy='dynamic')
 
     @property
     def reports(self):
         """Get all reports for this user through their assessments"""
-        from sqlalchemy.orm import joinedload
-        return db.session.query(Report).join(Assessment).filter(Assessment.user_id == self.id)
+        return db.session.query(Report).join(Report.assessment).filter(Assessment.user_id == self.id)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -48,18 +51,8 @@ class User(UserMixin, db.Model):
 
     def has_premium_access(self):
         """Check if user has access to premium assessment based on any successful payment"""
-        successful_payment = Payment.query.filter_by(
-            user_id=self.id,
-            assessment_type='premium',
-            status='succeeded'
-        ).first()
-
-        # Update is_premium flag if payment exists but flag is False
-        if successful_payment and not self.is_premium:
-            self.is_premium = True
-            db.session.commit()
-
-        return successful_payment is not None
+        from app.payment.entitlements import premium_payment_id
+        return premium_payment_id(self.id) is not None
 
     def __repr__(self):
         return f'<User {self.email}>'
@@ -72,11 +65,19 @@ class Assessment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
     payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'), nullable=True)
+    answer_vector = db.Column(db.LargeBinary)  # Packed answers, one byte per question (see app.assessment.answers)
+    answered_count = db.Column(db.Integer, default=0)
+    answered_bitmap = db.Column(db.LargeBinary)  # Bit i set when plan question i is answered
 
     # Relationships
     responses = db.relationship('Response', backref='assessment', lazy='dynamic', cascade='all, delete-orphan')
     reports = db.relationship('Report', backref='assessment', lazy='dynamic', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_assessment_user_type_completed', 'user_id', 'type', 'completed', 'payment_id'),
+        db.Index('ix_assessment_created_at', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Assessment {self.id} - {self.type}>'
 
@@ -87,18 +88,40 @@ class Response(db.Model):
     answer = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint('assessment_id', 'question_id', name='uq_response_assessment_question'),
+    )
+
     def __repr__(self):
         return f'<Response {self.id} - Q{self.question_id}>'
 
 class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     assessment_id = db.Column(db.Integer, db.ForeignKey('assessment.id'), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    body_digest = db.Column(db.String(64), db.ForeignKey('report_body.digest'), index=True)
+    overall_score = db.Column(db.Float)
+    category = db.Column(db.String(100))
+    data = db.deferred(db.Column(db.JSON))  # Per-report data merged over the shared body (see app.reports.content)
+    content = db.deferred(db.Column(db.Text))  # Pre-rendered HTML for reports generated before structured storage
     generated_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_report_assessment_generated', 'assessment_id', 'generated_at'),
+        db.Index('ix_report_generated_at', 'generated_at'),
+    )
+
     def __repr__(self):
         return f'<Report {self.id}>'
 
+class ReportBody(db.Model):
+    """Report content shared by every report with the same instrument, scoring version and answers"""
+    digest = db.Column(db.String(64), primary_key=True)  # sha256 of (instrument, scoring version, answers)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ReportBody {self.digest[:12]}>'
+
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -114,9 +137,111 @@ class Payment(db.Model):
     user = db.relationship('User', backref='payments')
     assessments = db.relationship('Assessment', backref='payment')
 
+    __table_args__ = (
+        db.Index('ix_payment_user_type_status', 'user_id', 'assessment_type', 'status'),
+        db.Index('ix_payment_created_at', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Payment {self.id} - {self.stripe_payment_intent_id}>'
 
+class WebhookEvent(db.Model):
+    """Stripe webhook event received and awaiting (or done) application (see app.payment.webhooks)"""
+    id = db.Column(db.String(255), primary_key=True)  # Stripe event id, so redeliveries are stored once
+    type = db.Column(db.String(100), nullable=False)
+    payment_intent_id = db.Column(db.String(255))
+    payload = db.Column(db.JSON, nullable=False)  # The event's PaymentIntent fields we use
+    stripe_created = db.Column(db.Integer)  # Event creation time at Stripe, for per-intent ordering
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, applying, applied, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Visible to the worker from this time
+    locked_by = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_webhook_event_status_run_after', 'status', 'run_after'),
+    )
+
+    def __repr__(self):
+        return f'<WebhookEvent {self.id} - {self.type} ({self.status})>'
+
+class Entitlement(db.Model):
+    """A user's access to a paid product, kept in sync with Payment (see app.payment.entitlements)"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product = db.Column(db.String(50), nullable=False)  # Payment.assessment_type, e.g. premium
+    payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'))  # Succeeded payment granting access, None when revoked
+    granted_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product', name='uq_entitlement_user_product'),
+    )
+
+    def __repr__(self):
+        return f'<Entitlement {self.user_id} - {self.product} ({self.payment_id})>'
+
+class StatCounter(db.Model):
+    """Site-wide counter kept up to date by mapper hooks (see app.stats)"""
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StatCounter {self.name} = {self.value}>'
+
+class DailyMetric(db.Model):
+    """Per-day rollup of an analytics metric (see app.admin.metrics)"""
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)  # e.g. signups, completed_premium, revenue_cents
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DailyMetric {self.day} {self.metric} = {self.value}>'
+
+class JobCheckpoint(db.Model):
+    """Resume position for long-running maintenance jobs"""
+    name = db.Column(db.String(100), primary_key=True)
+    position = db.Column(db.String(255))  # Job-specific cursor, e.g. last processed id
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def get(cls, name):
+        """Return the checkpoint for a job, creating it if needed"""
+        checkpoint = db.session.get(cls, name)
+        if checkpoint is None:
+            checkpoint = cls(name=name)
+            db.session.add(checkpoint)
+        return checkpoint
+
+    def __repr__(self):
+        return f'<JobCheckpoint {self.name} @ {self.position}>'
+
+class Job(db.Model):
+    """Background job processed by `flask jobs work` (see app.jobs)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    key = db.Column(db.String(100), unique=True)  # Optional dedupe key, e.g. report:<assessment_id>
+    payload = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Visible to workers from this time
+    locked_by = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} - {self.kind} ({self.status})>'
+
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
\ No newline at end of file
+    # A cached Identity rather than the User row (see app.identity)
+    from app.identity import load_identity
+    return load_identity(int(id))
\ No newline at end of file
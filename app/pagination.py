@@ -0,0 +1,81 @@
+"""Keyset (cursor) pagination.
+
+Pages are ordered newest first by a sort column plus the primary key as a tie
+breaker, with rows whose sort value is NULL last (by id). The cursor is the
+(sort value, id) of the last row shown, encoded as an opaque URL-safe token;
+the next page is the rows strictly after it, so page cost does not grow with
+depth the way OFFSET does. A cursor whose value does not fit the sort column
+(a tampered or stale link) is ignored and the first page is shown.
+"""
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor', 'cursor'])
+
+
+def encode_cursor(value, id):
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    token = json.dumps([value, id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort value, id) from a cursor token, or None if it is missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['dt'])
+        return value, int(id)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+def _fits(value, column):
+    """Whether a decoded cursor value can be compared with the sort column"""
+    if value is None:
+        return True
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return False
+    if isinstance(value, bool) and python_type is not bool:
+        return False
+    if python_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, python_type)
+
+
+def keyset_paginate(query, sort_column, id_column, per_page, cursor=None, key=None):
+    """Return one page of `query` ordered by (sort_column, id_column) descending.
+
+    `key` maps a result row to its (sort value, id) when rows are not plain
+    entities carrying those attributes.
+    """
+    position = decode_cursor(cursor)
+    if position is not None and not _fits(position[0], sort_column):
+        position = None
+    if position is not None:
+        value, id = position
+        if value is None:
+            query = query.filter(sort_column.is_(None), id_column < id)
+        else:
+            query = query.filter(or_(
+                sort_column < value,
+                and_(sort_column == value, id_column < id),
+                sort_column.is_(None)
+            ))
+
+    rows = query.order_by(sort_column.desc().nulls_last(), id_column.desc()).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        value, id = key(last) if key else (getattr(last, sort_column.key), getattr(last, id_column.key))
+        next_cursor = encode_cursor(value, id)
+    return KeysetPage(items, next_cursor, cursor if position is not None else None)
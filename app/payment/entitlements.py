@@ -0,0 +1,78 @@
+"""Paid product entitlements.
+
+The Entitlement table is the authoritative record of which users may take a
+paid assessment. sync_entitlement rewrites it from the user's Payment rows and
+must be called whenever a payment changes state (payment_success and the
+Stripe webhook); it also drops the user from this process's TTL cache.
+
+Only granted entitlements are cached, so a new purchase is seen at once by
+every process, while a revocation reaches other processes within
+ENTITLEMENT_CACHE_TTL seconds.
+"""
+import logging
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.cache import TTLCache
+from app.models import Entitlement, Payment, User
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+
+
+def get_entitlement_cache():
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(current_app.config['ENTITLEMENT_CACHE_SIZE'],
+                          current_app.config['ENTITLEMENT_CACHE_TTL'])
+    return _cache
+
+
+def entitled_payment_id(user_id, product):
+    """Id of the payment granting a user a product, or None without access"""
+    cache = get_entitlement_cache()
+    payment_id = cache.get((user_id, product))
+    if payment_id is None:
+        payment_id = db.session.query(Entitlement.payment_id).filter_by(
+            user_id=user_id,
+            product=product
+        ).scalar()
+        if payment_id is not None:
+            cache.set((user_id, product), payment_id)
+    return payment_id
+
+
+def premium_payment_id(user_id):
+    return entitled_payment_id(user_id, 'premium')
+
+
+def invalidate_entitlement(user_id, product='premium'):
+    get_entitlement_cache().pop((user_id, product))
+
+
+def sync_entitlement(user_id, product='premium'):
+    """Recompute a user's entitlement from their payments; the caller commits"""
+    payment = Payment.query.filter_by(
+        user_id=user_id,
+        assessment_type=product,
+        status='succeeded'
+    ).order_by(Payment.id).first()
+
+    entitlement = Entitlement.query.filter_by(user_id=user_id, product=product).first()
+    if entitlement is None:
+        entitlement = Entitlement(user_id=user_id, product=product)
+        db.session.add(entitlement)
+
+    if payment is not None and entitlement.payment_id is None:
+        entitlement.granted_at = datetime.utcnow()
+        logger.info(f"Granted {product} entitlement to user {user_id} via payment {payment.id}")
+    elif payment is None and entitlement.payment_id is not None:
+        logger.warning(f"Revoked {product} entitlement from user {user_id}")
+    entitlement.payment_id = payment.id if payment else None
+
+    if product == 'premium':
+        db.session.get(User, user_id).is_premium = payment is not None
+
+    invalidate_entitlement(user_id, product)
+    return entitlement
@@ -0,0 +1,177 @@
+"""A local fake of the Stripe API, for load-testing checkout without a network.
+
+Run it with `flask stripe fake-server` and point the app at it with
+STRIPE_API_BASE=http://127.0.0.1:12111. It keeps PaymentIntents in memory and
+implements the calls the app makes: create (honouring Idempotency-Key),
+retrieve and cancel. It adds one call that a browser would otherwise make through
+Stripe.js:
+
+    POST /v1/payment_intents/<id>/confirm   payment_method=pm_card_visa
+
+This succeeds the intent, or fails it for pm_card_chargeDeclined. Either way
+it then delivers the matching payment_intent.* webhook to --webhook-url,
+signed with STRIPE_WEBHOOK_SECRET, shortly after responding, as Stripe does.
+A load test can therefore drive the whole flow over HTTP: create the intent,
+confirm it here, then land on /payment/payment-success. --latency-ms adds a
+fixed delay to every API response to mimic the network.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from flask import Flask, request, jsonify
+
+logger = logging.getLogger(__name__)
+
+DECLINED_PAYMENT_METHODS = ['pm_card_chargeDeclined', 'pm_card_visa_chargeDeclined']
+
+# metadata[user_id] -> ('metadata', 'user_id')
+_NESTED_KEY = re.compile(r'^(\w+)\[(\w+)\]$')
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """A Stripe-Signature header for `payload` (bytes)"""
+    timestamp = timestamp or int(time.time())
+    signed = f'{timestamp}.'.encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def _form_params(form):
+    params = {}
+    for key, value in form.items():
+        match = _NESTED_KEY.match(key)
+        if match:
+            params.setdefault(match.group(1), {})[match.group(2)] = value
+        else:
+            params[key] = value
+    return params
+
+
+def _error(status, message, error_type='invalid_request_error', code=None):
+    error = {'type': error_type, 'message': message}
+    if code:
+        error['code'] = code
+    return jsonify({'error': error}), status
+
+
+def create_fake_stripe(webhook_url=None, webhook_secret=None, latency=0.0):
+    """The fake Stripe API as a WSGI app"""
+    app = Flask(__name__)
+    lock = threading.Lock()
+    intents = {}
+    idempotent_responses = {}
+    # Webhook deliveries run off the request thread, a few at a time
+    deliveries = ThreadPoolExecutor(max_workers=4)
+    webhooks = requests.Session()
+
+    def deliver(event):
+        payload = json.dumps(event).encode()
+        headers = {'Content-Type': 'application/json'}
+        if webhook_secret:
+            headers['Stripe-Signature'] = sign_payload(payload, webhook_secret)
+        try:
+            response = webhooks.post(webhook_url, data=payload, headers=headers, timeout=10)
+            logger.info(f"Delivered {event['type']} {event['id']}: HTTP {response.status_code}")
+        except requests.RequestException as e:
+            logger.warning(f"Delivering {event['type']} {event['id']} failed: {e}")
+
+    def send_event(event_type, intent):
+        if not webhook_url:
+            return
+        event = {
+            'id': 'evt_' + secrets.token_hex(12),
+            'object': 'event',
+            'type': event_type,
+            'created': int(time.time()),
+            'livemode': False,
+            'data': {'object': dict(intent)},
+        }
+        deliveries.submit(deliver, event)
+
+    @app.before_request
+    def simulate_latency():
+        if latency:
+            time.sleep(latency)
+
+    @app.route('/v1/payment_intents', methods=['POST'])
+    def create_payment_intent():
+        key = request.headers.get('Idempotency-Key')
+        with lock:
+            if key and key in idempotent_responses:
+                return jsonify(idempotent_responses[key])
+
+            params = _form_params(request.form)
+            if not params.get('amount') or not params.get('currency'):
+                return _error(400, 'Missing required param: amount and currency.', code='parameter_missing')
+            intent_id = 'pi_' + secrets.token_hex(12)
+            intent = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(params['amount']),
+                'currency': params['currency'],
+                'metadata': params.get('metadata', {}),
+                'status': 'requires_payment_method',
+                'client_secret': f'{intent_id}_secret_{secrets.token_hex(12)}',
+                'created': int(time.time()),
+                'last_payment_error': None,
+                'livemode': False,
+            }
+            intents[intent_id] = intent
+            if key:
+                idempotent_responses[key] = intent
+            return jsonify(intent)
+
+    @app.route('/v1/payment_intents/<intent_id>', methods=['GET'])
+    def retrieve_payment_intent(intent_id):
+        with lock:
+            intent = intents.get(intent_id)
+            if intent is None:
+                return _error(404, f"No such payment_intent: '{intent_id}'", code='resource_missing')
+            return jsonify(intent)
+
+    @app.route('/v1/payment_intents/<intent_id>/confirm', methods=['POST'])
+    def confirm_payment_intent(intent_id):
+        payment_method = request.form.get('payment_method', 'pm_card_visa')
+        with lock:
+            intent = intents.get(intent_id)
+            if intent is None:
+                return _error(404, f"No such payment_intent: '{intent_id}'", code='resource_missing')
+            if intent['status'] in ['succeeded', 'canceled']:
+                return _error(400, f"This PaymentIntent has already {intent['status']}.", code='payment_intent_unexpected_state')
+
+            if payment_method in DECLINED_PAYMENT_METHODS:
+                intent['status'] = 'requires_payment_method'
+                intent['last_payment_error'] = {'type': 'card_error', 'code': 'card_declined',
+                                                'message': 'Your card was declined.'}
+                event_type = 'payment_intent.payment_failed'
+            else:
+                intent['status'] = 'succeeded'
+                intent['last_payment_error'] = None
+                event_type = 'payment_intent.succeeded'
+            send_event(event_type, intent)
+            return jsonify(intent)
+
+    @app.route('/v1/payment_intents/<intent_id>/cancel', methods=['POST'])
+    def cancel_payment_intent(intent_id):
+        with lock:
+            intent = intents.get(intent_id)
+            if intent is None:
+                return _error(404, f"No such payment_intent: '{intent_id}'", code='resource_missing')
+            if intent['status'] in ['succeeded', 'canceled']:
+                return _error(400, f"This PaymentIntent has already {intent['status']}.", code='payment_intent_unexpected_state')
+            intent['status'] = 'canceled'
+            send_event('payment_intent.canceled', intent)
+            return jsonify(intent)
+
+    @app.errorhandler(404)
+    def not_found(e):
+        return _error(404, f'Unrecognized request URL ({request.method}: {request.path}).')
+
+    return app
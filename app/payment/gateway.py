@@ -0,0 +1,169 @@
+"""Stripe gateway.
+
+Every Stripe API call goes through this process's StripeGateway
+(get_gateway()). The gateway owns a StripeClient built on one pooled requests
+session, so connections to the API are reused across requests, and it passes
+the secret key to that client instead of setting the global stripe.api_key.
+
+Each call has a deadline: STRIPE_CONNECT_TIMEOUT seconds to connect and
+STRIPE_TIMEOUT seconds to read the response, unless the caller passes a
+shorter `timeout`. A call that runs past its deadline raises
+stripe.error.APIConnectionError, like any other network failure.
+
+Every call's latency is logged and added to this process's metrics
+(StripeGateway.metrics: calls, errors and p50/p95/max per operation). In debug
+mode or with QUERY_STATS_HEADER, responses also carry X-Stripe-Calls and
+X-Stripe-Time, like the query headers.
+
+STRIPE_API_BASE sends the calls to another server instead of Stripe, such as
+the fake one in app.payment.fake_stripe (`flask stripe fake-server`).
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+import requests
+import stripe
+from flask import current_app, g, has_request_context
+
+logger = logging.getLogger(__name__)
+
+# Recent latencies kept per operation for the percentiles
+METRIC_SAMPLES = 1000
+
+
+def _percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0.0
+
+
+class StripeCallMetrics:
+    """Stripe call counts, errors and recent latencies by operation"""
+
+    def __init__(self, samples=METRIC_SAMPLES):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.latencies = defaultdict(lambda: deque(maxlen=samples))
+
+    def record(self, operation, duration, error=False):
+        with self._lock:
+            self.calls[operation] += 1
+            if error:
+                self.errors[operation] += 1
+            self.latencies[operation].append(duration)
+
+    def snapshot(self):
+        """operation -> calls, errors and p50/p95/max latency (ms) over the recent calls"""
+        with self._lock:
+            latencies = {operation: sorted(values) for operation, values in self.latencies.items()}
+            calls = dict(self.calls)
+            errors = dict(self.errors)
+        return {
+            operation: {
+                'calls': calls[operation],
+                'errors': errors.get(operation, 0),
+                'p50_ms': round(_percentile(values, 0.5) * 1000, 1),
+                'p95_ms': round(_percentile(values, 0.95) * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1) if values else 0.0,
+            }
+            for operation, values in latencies.items()
+        }
+
+
+class StripeGateway:
+    """Stripe API calls over a pooled HTTP client, with deadlines and latency metrics"""
+
+    def __init__(self, secret_key, webhook_secret=None, api_base=None, timeout=10.0,
+                 connect_timeout=3.0, max_retries=1, pool_size=10):
+        self.webhook_secret = webhook_secret
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.metrics = StripeCallMetrics()
+        self._secret_key = secret_key
+        self._api_base = api_base
+        self._max_retries = max_retries
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        # One StripeClient per read timeout, all on the same session and pool
+        self._clients = {}
+
+    def _client(self, timeout=None):
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+        client = self._clients.get(timeout)
+        if client is None:
+            http_client = stripe.RequestsClient(timeout=(self.connect_timeout, timeout), session=self._session)
+            client = stripe.StripeClient(
+                self._secret_key,
+                http_client=http_client,
+                base_addresses={'api': self._api_base} if self._api_base else {},
+                max_network_retries=self._max_retries
+            )
+            client = self._clients.setdefault(timeout, client)
+        return client
+
+    def _call(self, operation, call):
+        started = time.perf_counter()
+        error = False
+        try:
+            return call()
+        except stripe.error.StripeError:
+            error = True
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.metrics.record(operation, duration, error)
+            if has_request_context():
+                g.stripe_calls = g.get('stripe_calls', 0) + 1
+                g.stripe_time = g.get('stripe_time', 0.0) + duration
+            logger.debug(f"Stripe {operation} {'failed' if error else 'returned'} in {duration * 1000:.1f}ms")
+
+    def create_payment_intent(self, amount, currency, metadata, idempotency_key=None, timeout=None):
+        options = {'idempotency_key': idempotency_key} if idempotency_key else {}
+        return self._call('payment_intents.create', lambda: self._client(timeout).payment_intents.create(
+            params={'amount': amount, 'currency': currency, 'metadata': metadata},
+            options=options
+        ))
+
+    def retrieve_payment_intent(self, payment_intent_id, timeout=None):
+        return self._call('payment_intents.retrieve',
+                          lambda: self._client(timeout).payment_intents.retrieve(payment_intent_id))
+
+    def cancel_payment_intent(self, payment_intent_id, timeout=None):
+        return self._call('payment_intents.cancel',
+                          lambda: self._client(timeout).payment_intents.cancel(payment_intent_id))
+
+    def construct_event(self, payload, sig_header):
+        """Verify a webhook delivery's signature and parse it (no API call)"""
+        return stripe.Webhook.construct_event(payload, sig_header, self.webhook_secret)
+
+
+def get_gateway():
+    """This process's gateway for the current app, created on first use (after any fork)"""
+    gateway = current_app.extensions.get('stripe_gateway')
+    if gateway is None:
+        config = current_app.config
+        gateway = current_app.extensions.setdefault('stripe_gateway', StripeGateway(
+            config['STRIPE_SECRET_KEY'],
+            webhook_secret=config['STRIPE_WEBHOOK_SECRET'],
+            api_base=config['STRIPE_API_BASE'],
+            timeout=config['STRIPE_TIMEOUT'],
+            connect_timeout=config['STRIPE_CONNECT_TIMEOUT'],
+            max_retries=config['STRIPE_MAX_NETWORK_RETRIES'],
+            pool_size=config['STRIPE_POOL_SIZE']
+        ))
+    return gateway
+
+
+def init_gateway(app):
+    """Report each request's Stripe calls in response headers (debug or QUERY_STATS_HEADER)"""
+
+    @app.after_request
+    def report_stripe_calls(response):
+        calls = g.get('stripe_calls')
+        if calls and (app.debug or app.config['QUERY_STATS_HEADER']):
+            response.headers['X-Stripe-Calls'] = str(calls)
+            response.headers['X-Stripe-Time'] = f"{g.stripe_time * 1000:.1f}ms"
+        return response
@@ -0,0 +1,126 @@
+"""PaymentIntent reuse for checkout.
+
+Each checkout click asks for an intent to confirm. open_payment_intent reuses
+the user's latest unpaid intent for the product while its payment is younger
+than PAYMENT_INTENT_REUSE_WINDOW. An intent that is still pending, or whose
+card was declined, can be confirmed again. The client secret comes from a
+per-process TTL cache, or from a single retrieve after a cache miss.
+
+An unpaid intent that is not reused is cancelled first, so an old checkout
+tab cannot be paid as well as the new one. If Stripe reports it already
+succeeded, the payment is settled and no new intent is created.
+
+A new intent is created with an idempotency key derived from the user's
+previous payment. Concurrent clicks therefore get the same intent back from
+Stripe, and the unique intent id keeps them to one Payment row. In the normal
+case a purchase costs one Stripe call however many times the button is
+clicked.
+"""
+import logging
+from datetime import datetime, timedelta
+import stripe
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.cache import TTLCache
+from app.models import Payment
+from app.payment.gateway import get_gateway
+from app.payment.webhooks import set_payment_status
+from app.payment.reconcile import refresh_payment
+
+logger = logging.getLogger(__name__)
+
+# Intent states in which the client can still confirm it
+REUSABLE_INTENT_STATUSES = ['requires_payment_method', 'requires_confirmation', 'requires_action']
+
+_cache = None
+
+
+def get_client_secret_cache():
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(current_app.config['PAYMENT_INTENT_CACHE_SIZE'],
+                          current_app.config['PAYMENT_INTENT_REUSE_WINDOW'])
+    return _cache
+
+
+def _reusable_client_secret(payment):
+    """The client secret of a payment's intent if it can still be confirmed, else None"""
+    cache = get_client_secret_cache()
+    client_secret = cache.get(payment.id)
+    if client_secret is None:
+        try:
+            intent = get_gateway().retrieve_payment_intent(payment.stripe_payment_intent_id)
+        except stripe.error.InvalidRequestError as e:
+            logger.warning(f"Not reusing PaymentIntent {payment.stripe_payment_intent_id}: {e}")
+            return None
+        if intent.status not in REUSABLE_INTENT_STATUSES:
+            return None
+        client_secret = intent.client_secret
+        cache.set(payment.id, client_secret)
+    return client_secret
+
+
+def _close_intent(payment):
+    """Cancel an unpaid payment's intent, settling the payment instead if Stripe says it was paid"""
+    try:
+        intent = get_gateway().cancel_payment_intent(payment.stripe_payment_intent_id)
+        set_payment_status(payment, 'failed', f'PaymentIntent {intent.id} ({intent.status})', 'Replaced by a new checkout')
+    except stripe.error.InvalidRequestError as e:
+        if e.code != 'payment_intent_unexpected_state':
+            logger.warning(f"Could not cancel PaymentIntent {payment.stripe_payment_intent_id}: {e}")
+            return
+        # Already succeeded or canceled
+        refresh_payment(payment)
+
+
+def open_payment_intent(user_id, product, amount, currency='usd'):
+    """(payment, client_secret) to check out with, reusing an open intent when possible; the caller commits.
+
+    The client secret is None when the user's latest payment turns out to have succeeded.
+    """
+    window_start = datetime.utcnow() - timedelta(seconds=current_app.config['PAYMENT_INTENT_REUSE_WINDOW'])
+    latest = Payment.query.filter_by(user_id=user_id, assessment_type=product).order_by(Payment.id.desc()).first()
+
+    if (latest is not None and latest.status in ['pending', 'failed'] and latest.created_at >= window_start
+            and latest.amount == amount and latest.currency == currency):
+        client_secret = _reusable_client_secret(latest)
+        if client_secret is not None:
+            logger.info(f"Reusing PaymentIntent {latest.stripe_payment_intent_id} (payment {latest.id}) for user {user_id}")
+            # A declined intent is being tried again
+            set_payment_status(latest, 'pending', 'checkout retry')
+            return latest, client_secret
+
+    if latest is not None and latest.status in ['pending', 'failed']:
+        _close_intent(latest)
+        if latest.status == 'succeeded':
+            return latest, None
+
+    # The same key for every click until this intent's payment exists
+    idempotency_key = f'payment-intent-{user_id}-{product}-after-{latest.id if latest else 0}'
+    intent = get_gateway().create_payment_intent(
+        amount=amount,
+        currency=currency,
+        metadata={'user_id': user_id, 'assessment_type': product},
+        idempotency_key=idempotency_key
+    )
+    logger.info(f"Stripe PaymentIntent created: {intent.id} for user {user_id}")
+
+    payment = Payment(
+        user_id=user_id,
+        stripe_payment_intent_id=intent.id,
+        amount=amount,
+        currency=currency,
+        status='pending',
+        assessment_type=product
+    )
+    try:
+        # Savepoint, so losing the race keeps the closed payment's status in the outer transaction
+        with db.session.begin_nested():
+            db.session.add(payment)
+    except IntegrityError:
+        # A concurrent click stored the same intent first
+        payment = Payment.query.filter_by(stripe_payment_intent_id=intent.id).one()
+
+    get_client_secret_cache().set(payment.id, intent.client_secret)
+    return payment, intent.client_secret
@@ -0,0 +1,180 @@
+"""Bringing local payments in line with Stripe.
+
+Webhooks normally settle a payment. refresh_payment is the fallback for when
+one is late or lost: it retrieves the PaymentIntent and applies its status
+with the same rules as the webhook (a succeeded payment is final).
+refresh_payment_once is the version the payment status poll uses: it
+retrieves a payment's intent at most once per PAYMENT_REFRESH_INTERVAL in
+each process, however many polls ask.
+
+reconcile_pending_payments (`flask payments reconcile`) does the same in bulk.
+It handles payments left pending longer than `older_than`, which block their
+users at checkout. It pages through them by id and retrieves each page's
+intents concurrently from a pool of `workers` threads sharing the gateway's
+connection pool. Then it locks the page's changed payments and applies them in
+one commit. A payment whose intent Stripe does not know is marked failed. So
+is one whose checkout was abandoned for longer than `abandon_after`, once its
+intent has been cancelled at Stripe. Cancelling first means the old client
+secret can no longer be confirmed, so the user cannot also pay an old intent
+after checking out again with a new one.
+"""
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import stripe
+from flask import current_app
+from app import db
+from app.cache import TTLCache
+from app.models import Payment
+from app.payment.gateway import get_gateway
+from app.payment.entitlements import sync_entitlement
+from app.payment.webhooks import set_payment_status
+
+logger = logging.getLogger(__name__)
+
+_refreshed = None
+
+
+def payment_status_for_intent(intent):
+    """The Payment.status a PaymentIntent's state corresponds to"""
+    if intent.status == 'succeeded':
+        return 'succeeded'
+    if intent.status == 'canceled' or (intent.status == 'requires_payment_method' and intent.get('last_payment_error')):
+        return 'failed'
+    return 'pending'
+
+
+def refresh_payment(payment, timeout=None):
+    """Retrieve a payment's intent from Stripe and apply its status; the caller commits"""
+    intent = get_gateway().retrieve_payment_intent(payment.stripe_payment_intent_id, timeout=timeout)
+    status = payment_status_for_intent(intent)
+    reason = (intent.get('last_payment_error') or {}).get('message')
+    if status != 'pending' and set_payment_status(payment, status, f'PaymentIntent {intent.id} ({intent.status})', reason):
+        sync_entitlement(payment.user_id, payment.assessment_type)
+    return payment.status
+
+
+def get_refreshed_cache():
+    global _refreshed
+    if _refreshed is None:
+        _refreshed = TTLCache(current_app.config['PAYMENT_INTENT_CACHE_SIZE'],
+                              current_app.config['PAYMENT_REFRESH_INTERVAL'])
+    return _refreshed
+
+
+def refresh_payment_once(payment):
+    """refresh_payment unless this process retrieved the payment's intent recently; True if it did now"""
+    cache = get_refreshed_cache()
+    if cache.get(payment.id):
+        return False
+    # Marked before the call, so concurrent polls do not all retrieve it
+    cache.set(payment.id, True)
+    refresh_payment(payment)
+    return True
+
+
+def _retrieve(gateway, payment_intent_id):
+    try:
+        return gateway.retrieve_payment_intent(payment_intent_id), None
+    except stripe.error.StripeError as e:
+        return None, e
+
+
+def _cancel(gateway, payment_intent_id):
+    try:
+        return gateway.cancel_payment_intent(payment_intent_id), None
+    except stripe.error.StripeError as e:
+        return None, e
+
+
+def _reconciled_status(row, intent, error, abandoned_before):
+    """(status, source, reason) for a pending payment, or None to leave it (and count it as an error).
+
+    Abandoned checkouts get the status 'abandoned'; their intents must be cancelled before they are failed.
+    """
+    if error is not None:
+        if isinstance(error, stripe.error.InvalidRequestError) and error.code == 'resource_missing':
+            return 'failed', 'reconciliation', 'PaymentIntent not found in Stripe'
+        logger.warning(f"Could not retrieve PaymentIntent {row.stripe_payment_intent_id} for payment {row.id}: {error}")
+        return None
+
+    status = payment_status_for_intent(intent)
+    source = f'reconciliation, PaymentIntent {intent.status}'
+    if status == 'pending' and row.created_at < abandoned_before:
+        return 'abandoned', source, 'Checkout abandoned'
+    return status, source, (intent.get('last_payment_error') or {}).get('message')
+
+
+def reconcile_pending_payments(older_than=1800, abandon_after=86400, batch_size=200, workers=8,
+                               limit=None, echo=print):
+    """Check payments pending for over `older_than` seconds against Stripe and apply their status"""
+    gateway = get_gateway()
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=older_than)
+    abandoned_before = now - timedelta(seconds=abandon_after)
+    totals = Counter()
+    started = time.monotonic()
+    last_id = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while limit is None or totals['checked'] < limit:
+            page = db.session.query(Payment.id, Payment.stripe_payment_intent_id, Payment.created_at).filter(
+                Payment.status == 'pending',
+                Payment.created_at < stale_before,
+                Payment.id > last_id
+            ).order_by(Payment.id).limit(batch_size if limit is None else min(batch_size, limit - totals['checked'])).all()
+            # Don't hold the read transaction open during the Stripe calls
+            db.session.rollback()
+            if not page:
+                break
+            last_id = page[-1].id
+
+            results = pool.map(lambda row: _retrieve(gateway, row.stripe_payment_intent_id), page)
+            updates = {}
+            for row, (intent, error) in zip(page, results):
+                update = _reconciled_status(row, intent, error, abandoned_before)
+                if update is None:
+                    totals['errors'] += 1
+                elif update[0] == 'pending':
+                    totals['pending'] += 1
+                else:
+                    updates[row.id] = update
+
+            abandoned = [row for row in page if updates.get(row.id, ('',))[0] == 'abandoned']
+            cancellations = pool.map(lambda row: _cancel(gateway, row.stripe_payment_intent_id), abandoned)
+            for row, (intent, error) in zip(abandoned, cancellations):
+                if error is not None:
+                    # Most likely paid meanwhile; the webhook or the next run settles it
+                    logger.warning(f"Could not cancel abandoned PaymentIntent {row.stripe_payment_intent_id} for payment {row.id}: {error}")
+                    del updates[row.id]
+                    totals['errors'] += 1
+                else:
+                    updates[row.id] = ('failed', f'reconciliation, PaymentIntent {intent.status}', 'Checkout abandoned')
+                    totals['canceled'] += 1
+
+            changed = set()
+            if updates:
+                # Locked, so a webhook applied meanwhile is seen (and a success never undone)
+                for payment in Payment.query.filter(Payment.id.in_(updates)).with_for_update():
+                    status, source, reason = updates[payment.id]
+                    if set_payment_status(payment, status, source, reason):
+                        totals[status] += 1
+                        changed.add((payment.user_id, payment.assessment_type))
+                    else:
+                        totals['unchanged'] += 1
+                for user_id, product in changed:
+                    sync_entitlement(user_id, product)
+            db.session.commit()
+
+            totals['checked'] += len(page)
+            elapsed = time.monotonic() - started
+            echo(f"Checked {totals['checked']} payments ({totals['checked'] / elapsed:.0f}/s): "
+                 f"{totals['succeeded']} succeeded, {totals['failed']} failed ({totals['canceled']} canceled), "
+                 f"{totals['pending']} still pending, {totals['errors']} errors")
+
+    elapsed = time.monotonic() - started
+    echo(f"Reconciled {totals['checked']} pending payments in {elapsed:.1f}s "
+         f"({totals['checked'] / elapsed if elapsed else 0:.0f}/s)")
+    return totals
@@ -1,11 +1,16 @@
 import stripe
 import logging
+import time
 from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
-from datetime import datetime
 from app import db
 from app.payment import bp
-from app.models import Payment, Assessment
+from app.models import Payment, WebhookEvent
+from app.payment.webhooks import record_event, apply_events
+from app.payment.gateway import get_gateway
+from app.payment.intents import open_payment_intent
+from app.payment.reconcile import refresh_payment_once
+from app.long_poll import long_poll_wait
 
 # Configure logger for Stripe payments
 logger = logging.getLogger(__name__)
@@ -24,18 +29,7 @@ def checkout_premium():
         flash('You already have access to the premium assessment.')
         return redirect(url_for('assessment.premium'))
 
-    # Check for pending payments
-    pending_payment = Payment.query.filter_by(
-        user_id=current_user.id,
-        assessment_type='premium',
-        status='pending'
-    ).first()
-
-    if pending_payment:
-        logger.warning(f"User {current_user.id} has pending payment {pending_payment.id}")
-        flash('You have a pending payment. Please complete it or contact support.')
-        return redirect(url_for('dashboard.index'))
-
+    # A pending payment does not block checkout: create_payment_intent reuses its open intent
     logger.info(f"Showing checkout page to user {current_user.id}")
     return render_template('payment/checkout.html',
                          amount=1000,  # $10.00 in cents
@@ -48,37 +42,17 @@ def create_payment_intent():
     logger.info(f"Creating payment intent for user {current_user.id}")
 
     try:
-        stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-        logger.debug(f"Stripe API key configured for user {current_user.id}")
-
-        # Create payment intent
-        logger.debug(f"Creating Stripe PaymentIntent for user {current_user.id}, amount: 1000 cents")
-        intent = stripe.PaymentIntent.create(
-            amount=1000,  # $10.00 in cents
-            currency='usd',
-            metadata={
-                'user_id': current_user.id,
-                'assessment_type': 'premium'
-            }
-        )
-        logger.info(f"Stripe PaymentIntent created successfully: {intent.id} for user {current_user.id}")
-        logger.debug(f"PaymentIntent details - ID: {intent.id}, Status: {intent.status}, Amount: {intent.amount}, Currency: {intent.currency}")
-
-        # Store payment in database
-        payment = Payment(
-            user_id=current_user.id,
-            stripe_payment_intent_id=intent.id,
-            amount=1000,
-            currency='usd',
-            status='pending',
-            assessment_type='premium'
-        )
-        db.session.add(payment)
+        # Reuse the user's open intent, or create one (one Stripe call per purchase, not per click)
+        payment, client_secret = open_payment_intent(current_user.id, 'premium', amount=1000)  # $10.00 in cents
         db.session.commit()
-        logger.info(f"Payment record created in database: ID {payment.id} for user {current_user.id}")
+        if client_secret is None:
+            logger.info(f"Payment {payment.id} for user {current_user.id} had already succeeded")
+            return jsonify({'error': 'Your payment has already been received.',
+                            'redirect': url_for('assessment.premium')}), 409
+        logger.info(f"Payment {payment.id} ready for checkout for user {current_user.id}, PaymentIntent {payment.stripe_payment_intent_id}")
 
         response_data = {
-            'client_secret': intent.client_secret,
+            'client_secret': client_secret,
             'payment_id': payment.id
         }
         logger.debug(f"Returning client_secret and payment_id {payment.id} to user {current_user.id}")
@@ -109,7 +83,7 @@ def create_payment_intent():
 @bp.route('/payment-success')
 @login_required
 def payment_success():
-    """Handle successful payment and create assessment"""
+    """Landing page after checkout, rendered from the local payment record"""
     payment_intent_id = request.args.get('payment_intent')
     logger.info(f"Payment success callback for user {current_user.id}, payment_intent: {payment_intent_id}")
 
@@ -129,59 +103,61 @@ def payment_success():
         flash('Payment record not found.')
         return redirect(url_for('dashboard.index'))
 
-    logger.info(f"Found payment record {payment.id} for user {current_user.id}")
+    logger.info(f"Found payment record {payment.id} for user {current_user.id} with status: {payment.status}")
 
-    # Verify payment with Stripe
-    try:
-        stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-        logger.debug(f"Retrieving PaymentIntent {payment_intent_id} from Stripe for user {current_user.id}")
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-        logger.info(f"Retrieved PaymentIntent {payment_intent_id} with status: {intent.status}")
-        logger.debug(f"PaymentIntent details - Amount: {intent.amount}, Currency: {intent.currency}")
+    if payment.status == 'succeeded':
+        # The premium assessment is created on first visit
+        flash('Payment successful! You can now take the comprehensive assessment.')
+        return redirect(url_for('assessment.premium'))
+    if payment.status == 'failed':
+        logger.warning(f"Payment {payment.id} failed for user {current_user.id}")
+        flash('Payment was not successful. Please try again.')
+        return redirect(url_for('payment.checkout_premium'))
 
-        if intent.status == 'succeeded':
-            logger.info(f"Payment succeeded for user {current_user.id}, updating payment {payment.id}")
-            # Update payment status
-            payment.status = 'succeeded'
-            payment.updated_at = datetime.utcnow()
+    # Still pending: the page waits on payment.status until the webhook settles it
+    return render_template('payment/processing.html', title='Confirming Payment', payment=payment,
+                           wait=current_app.config['PAYMENT_CONFIRM_TIMEOUT'],
+                           poll_limit=current_app.config['PAYMENT_POLL_LIMIT'])
 
-            # Create premium assessment
-            assessment = Assessment(
-                user_id=current_user.id,
-                type='premium',
-                payment_id=payment.id
-            )
-            db.session.add(assessment)
+@bp.route('/status/<int:payment_id>')
+@login_required
+def status(payment_id):
+    """JSON payment status; pass ?wait=<seconds> to long-poll until the webhook settles it.
+
+    Once the page has waited PAYMENT_CONFIRM_TIMEOUT in total (its ?elapsed=
+    plus this request's wait) for a payment that is still pending, the
+    PaymentIntent is retrieved from Stripe in case the webhook is late or
+    lost. That happens at most once per PAYMENT_REFRESH_INTERVAL per payment.
+    """
+    payment = Payment.query.get_or_404(payment_id)
+
+    if payment.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    max_wait = current_app.config['PAYMENT_CONFIRM_TIMEOUT']
+    wait = long_poll_wait(max_wait)
+    deadline = time.monotonic() + wait
+    while payment.status == 'pending' and time.monotonic() < deadline:
+        # End the transaction so the next check sees the webhook's commit
+        db.session.rollback()
+        time.sleep(0.5)
+
+    waited = max(request.args.get('elapsed', 0, type=float), 0) + wait
+    if payment.status == 'pending' and waited >= max_wait:
+        try:
+            if refresh_payment_once(payment):
+                logger.info(f"No webhook for payment {payment.id} after {waited:.0f}s, retrieved PaymentIntent {payment.stripe_payment_intent_id}")
             db.session.commit()
-            logger.info(f"Created premium assessment {assessment.id} for user {current_user.id}")
-
-            flash('Payment successful! You can now take the comprehensive assessment.')
-            return redirect(url_for('assessment.premium'))
-        else:
-            logger.warning(f"Payment intent {payment_intent_id} has status '{intent.status}' instead of 'succeeded' for user {current_user.id}")
-            flash('Payment was not successful. Please try again.')
-            return redirect(url_for('payment.checkout_premium'))
+        except stripe.error.StripeError as e:
+            db.session.rollback()
+            logger.error(f"Stripe error retrieving payment intent {payment.stripe_payment_intent_id} for user {current_user.id}: {e}")
 
-    except stripe.error.InvalidRequestError as e:
-        logger.error(f"Stripe InvalidRequestError retrieving payment intent {payment_intent_id} for user {current_user.id}: {e}")
-        flash('Error verifying payment. Please contact support.')
-        return redirect(url_for('dashboard.index'))
-    except stripe.error.AuthenticationError as e:
-        logger.error(f"Stripe AuthenticationError retrieving payment intent {payment_intent_id} for user {current_user.id}: {e}")
-        flash('Error verifying payment. Please contact support.')
-        return redirect(url_for('dashboard.index'))
-    except stripe.error.APIConnectionError as e:
-        logger.error(f"Stripe APIConnectionError retrieving payment intent {payment_intent_id} for user {current_user.id}: {e}")
-        flash('Error verifying payment. Please contact support.')
-        return redirect(url_for('dashboard.index'))
-    except stripe.error.StripeError as e:
-        logger.error(f"Stripe error retrieving payment intent {payment_intent_id} for user {current_user.id}: {e}")
-        flash('Error verifying payment. Please contact support.')
-        return redirect(url_for('dashboard.index'))
-    except Exception as e:
-        logger.error(f"Unexpected error verifying payment intent {payment_intent_id} for user {current_user.id}: {str(e)}", exc_info=True)
-        flash('Error verifying payment. Please contact support.')
-        return redirect(url_for('dashboard.index'))
+    response_data = {'status': payment.status}
+    if payment.status == 'succeeded':
+        response_data['next_url'] = url_for('assessment.premium')
+    elif payment.status == 'failed':
+        response_data['next_url'] = url_for('payment.checkout_premium')
+    return jsonify(response_data)
 
 @bp.route('/webhook', methods=['POST'])
 def stripe_webhook():
@@ -193,67 +169,22 @@ def stripe_webhook():
     logger.debug(f"Webhook payload size: {len(payload)} bytes")
 
     try:
-        stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-        endpoint_secret = current_app.config['STRIPE_WEBHOOK_SECRET']
-
         logger.debug("Constructing Stripe webhook event")
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, endpoint_secret
-        )
+        event = get_gateway().construct_event(payload, sig_header)
         logger.info(f"Webhook event verified successfully: {event['type']}, ID: {event['id']}")
 
-        if event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            payment_intent_id = payment_intent['id']
-            logger.info(f"Processing payment_intent.succeeded webhook for PaymentIntent: {payment_intent_id}")
-            logger.debug(f"PaymentIntent details - Amount: {payment_intent.get('amount')}, Currency: {payment_intent.get('currency')}")
-
-            # Update payment status in database
-            payment = Payment.query.filter_by(
-                stripe_payment_intent_id=payment_intent_id
-            ).first()
-
-            if payment:
-                logger.info(f"Found payment record {payment.id} for PaymentIntent {payment_intent_id}, updating status to succeeded")
-                payment.status = 'succeeded'
-                payment.updated_at = datetime.utcnow()
-                db.session.commit()
-                logger.info(f"Payment {payment.id} status updated to succeeded via webhook")
-            else:
-                logger.warning(f"No payment record found for PaymentIntent {payment_intent_id} in webhook")
-
-        elif event['type'] == 'payment_intent.payment_failed':
-            payment_intent = event['data']['object']
-            payment_intent_id = payment_intent['id']
-            failure_reason = payment_intent.get('last_payment_error', {}).get('message', 'Unknown')
-            logger.warning(f"Processing payment_intent.payment_failed webhook for PaymentIntent: {payment_intent_id}, reason: {failure_reason}")
-
-            # Update payment status in database
-            payment = Payment.query.filter_by(
-                stripe_payment_intent_id=payment_intent_id
-            ).first()
+        # Store the event (once per event id) and acknowledge; see app.payment.webhooks
+        if not record_event(event):
+            logger.info(f"Webhook event {event['id']} already received, skipping")
+        db.session.commit()
 
-            if payment:
-                logger.info(f"Found payment record {payment.id} for PaymentIntent {payment_intent_id}, updating status to failed")
-                payment.status = 'failed'
-                payment.updated_at = datetime.utcnow()
+        if not current_app.config['WEBHOOK_INBOX_ENABLED']:
+            webhook_event = db.session.get(WebhookEvent, event['id'])
+            if webhook_event.status == 'pending':
+                apply_events([webhook_event])
                 db.session.commit()
-                logger.warning(f"Payment {payment.id} status updated to failed via webhook, reason: {failure_reason}")
-            else:
-                logger.warning(f"No payment record found for PaymentIntent {payment_intent_id} in webhook")
-
-        elif event['type'] == 'payment_intent.requires_payment_method':
-            payment_intent = event['data']['object']
-            logger.info(f"PaymentIntent {payment_intent['id']} requires payment method")
-
-        elif event['type'] == 'payment_intent.processing':
-            payment_intent = event['data']['object']
-            logger.info(f"PaymentIntent {payment_intent['id']} is processing")
-
-        else:
-            logger.info(f"Unhandled webhook event type: {event['type']}")
 
-        logger.debug(f"Webhook {event['id']} processed successfully")
+        logger.debug(f"Webhook {event['id']} acknowledged")
         return jsonify({'status': 'success'})
 
     except ValueError as e:
@@ -0,0 +1,192 @@
+"""Stripe webhook inbox.
+
+The webhook endpoint verifies each delivery and inserts it into the
+webhook_event table, keyed by the Stripe event id. A retried or duplicated
+delivery becomes a no-op insert, and Stripe gets its 200 right away.
+
+With WEBHOOK_INBOX_ENABLED, `flask webhooks work` applies the stored events.
+It claims up to `batch_size` visible events at a time (the same visibility
+timeout scheme as app.jobs), then applies them in Stripe creation order, so
+each PaymentIntent sees its events in order. Each batch updates the affected
+payments and entitlements and commits once. A succeeded payment is final: a
+late or out-of-order failure event for the same intent does not undo it.
+Without WEBHOOK_INBOX_ENABLED, the endpoint applies the event itself right
+after storing it.
+"""
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from app import db
+from app.models import Payment, WebhookEvent
+from app.assessment.answers import UPSERT_INSERTS
+from app.payment.entitlements import sync_entitlement
+
+logger = logging.getLogger(__name__)
+
+# Event type -> Payment.status it records
+PAYMENT_STATUSES = {
+    'payment_intent.succeeded': 'succeeded',
+    'payment_intent.payment_failed': 'failed',
+    'payment_intent.canceled': 'failed',
+}
+
+
+def _event_fields(event):
+    """The columns stored for a verified Stripe event"""
+    intent = event['data']['object']
+    is_intent = event['type'].startswith('payment_intent.')
+    error = intent.get('last_payment_error') or {}
+    return {
+        'id': event['id'],
+        'type': event['type'],
+        'payment_intent_id': intent.get('id') if is_intent else None,
+        'payload': {
+            'amount': intent.get('amount'),
+            'currency': intent.get('currency'),
+            'failure_reason': error.get('message'),
+        },
+        'stripe_created': event.get('created'),
+    }
+
+
+def record_event(event):
+    """Store a verified event unless it was already received; the caller commits.
+
+    Returns True for a new event, False for a redelivery.
+    """
+    fields = _event_fields(event)
+    now = datetime.utcnow()
+    insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        result = db.session.execute(
+            insert(WebhookEvent)
+            .values(status='pending', attempts=0, run_after=now, received_at=now, **fields)
+            .on_conflict_do_nothing(index_elements=['id'])
+        )
+        return result.rowcount == 1
+
+    if db.session.get(WebhookEvent, fields['id']) is not None:
+        return False
+    db.session.add(WebhookEvent(status='pending', attempts=0, run_after=now, received_at=now, **fields))
+    return True
+
+
+def set_payment_status(payment, status, source, reason=None):
+    """Move a payment to `status` unless it already succeeded; returns whether it changed.
+
+    The caller syncs the entitlement and commits.
+    """
+    if payment.status == 'succeeded' and status != 'succeeded':
+        logger.warning(f"Ignoring {status} for payment {payment.id} from {source}: payment already succeeded")
+        return False
+    if payment.status == status:
+        return False
+    logger.info(f"Payment {payment.id} status {payment.status} -> {status} via {source}")
+    if status == 'failed':
+        logger.warning(f"Payment {payment.id} failed, reason: {reason or 'Unknown'}")
+    payment.status = status
+    payment.updated_at = datetime.utcnow()
+    return True
+
+
+def apply_events(events):
+    """Apply events to their payments in order and mark them applied; the caller commits"""
+    intent_ids = {event.payment_intent_id for event in events if event.type in PAYMENT_STATUSES}
+    payments = {}
+    if intent_ids:
+        # Row locks keep concurrent appliers of the same intent in order (no-op on SQLite)
+        payments = {payment.stripe_payment_intent_id: payment for payment in Payment.query.filter(
+            Payment.stripe_payment_intent_id.in_(intent_ids)
+        ).with_for_update()}
+
+    now = datetime.utcnow()
+    changed = set()
+    for event in sorted(events, key=lambda event: (event.stripe_created or 0, event.id)):
+        status = PAYMENT_STATUSES.get(event.type)
+        if status is None:
+            logger.info(f"Webhook event {event.id}: nothing to apply for {event.type}")
+        elif event.payment_intent_id not in payments:
+            logger.warning(f"No payment record found for PaymentIntent {event.payment_intent_id} in webhook event {event.id}")
+        else:
+            payment = payments[event.payment_intent_id]
+            if set_payment_status(payment, status, f'webhook event {event.id}', event.payload.get('failure_reason')):
+                changed.add((payment.user_id, payment.assessment_type))
+
+        event.status = 'applied'
+        event.applied_at = now
+        event.last_error = None
+
+    for user_id, product in changed:
+        sync_entitlement(user_id, product)
+
+
+def claim_events(worker_id, batch_size, visibility_timeout):
+    """Claim up to `batch_size` visible events, oldest first"""
+    now = datetime.utcnow()
+    visible = (WebhookEvent.status.in_(['pending', 'applying']), WebhookEvent.run_after <= now)
+    ids = [event_id for event_id, in db.session.query(WebhookEvent.id).filter(*visible).order_by(
+        WebhookEvent.stripe_created, WebhookEvent.id
+    ).limit(batch_size)]
+    if not ids:
+        db.session.rollback()
+        return []
+
+    # Only events still visible are taken, so two workers never claim the same one
+    db.session.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_(ids), *visible)
+        .values(status='applying',
+                run_after=now + timedelta(seconds=visibility_timeout),
+                attempts=WebhookEvent.attempts + 1,
+                locked_by=worker_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return WebhookEvent.query.filter(
+        WebhookEvent.id.in_(ids),
+        WebhookEvent.status == 'applying',
+        WebhookEvent.locked_by == worker_id
+    ).all()
+
+
+def apply_batch(events):
+    """Apply claimed events in one transaction, scheduling a retry if it fails"""
+    try:
+        apply_events(events)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        max_attempts = current_app.config['JOB_MAX_ATTEMPTS']
+        for event in WebhookEvent.query.filter(WebhookEvent.id.in_([event.id for event in events])):
+            event.last_error = str(e)
+            if event.attempts >= max_attempts:
+                event.status = 'failed'
+            else:
+                event.status = 'pending'
+                event.run_after = datetime.utcnow() + timedelta(seconds=2 ** event.attempts)
+        db.session.commit()
+        logger.error(f"Applying {len(events)} webhook events failed, will retry: {e}", exc_info=True)
+        return False
+
+
+def work(batch_size=100, poll_interval=1.0, visibility_timeout=None, once=False):
+    """Apply webhook events until interrupted (or until the inbox is empty with once=True)"""
+    visibility_timeout = visibility_timeout or current_app.config['JOB_VISIBILITY_TIMEOUT']
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    logger.info(f"Webhook worker {worker_id} started")
+    applied = 0
+    while True:
+        events = claim_events(worker_id, batch_size, visibility_timeout)
+        if not events:
+            if once:
+                return applied
+            time.sleep(poll_interval)
+            continue
+        if apply_batch(events):
+            applied += len(events)
+            logger.info(f"Applied {len(events)} webhook events")
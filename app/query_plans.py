@@ -0,0 +1,114 @@
+"""Query-plan checks for the app's hot queries.
+
+Each hot query is EXPLAINed against the configured database (EXPLAIN QUERY
+PLAN on SQLite, EXPLAIN with sequential scans disabled on PostgreSQL) and
+flagged if the plan reads any table without an index. Run it with
+`flask queries check-plans` against each database the app is deployed on;
+other databases are skipped with a message. tests/test_query_plans.py runs
+the check against a freshly migrated SQLite database.
+"""
+import re
+from datetime import datetime
+from sqlalchemy import select, or_
+from app import db
+from app.models import User, Assessment, Response, Report, ReportBody, Payment, Entitlement, Job
+
+_now = datetime(2025, 1, 1)
+
+HOT_QUERIES = {
+    'user by email': lambda: select(User).filter_by(email='user@example.com'),
+    'user by reset token': lambda: select(User).filter_by(reset_token='token'),
+    'simple assessment for user': lambda: select(Assessment).filter_by(user_id=1, completed=False).limit(1),
+    'premium assessment for user': lambda: select(Assessment).filter_by(
+        user_id=1, type='premium', completed=False, payment_id=1).limit(1),
+    'assessments for user by date': lambda: select(Assessment).filter_by(user_id=1).order_by(Assessment.created_at.desc()),
+    'responses for assessment': lambda: select(Response).filter_by(assessment_id=1).order_by(Response.question_id),
+    'responses for questions': lambda: select(Response).filter(
+        Response.assessment_id == 1, Response.question_id.in_([1, 2, 3])),
+    'report for assessment': lambda: select(Report).filter_by(assessment_id=1).limit(1),
+    'reports for assessment by date': lambda: select(Report).filter_by(assessment_id=1).order_by(Report.generated_at.desc()),
+    'reports for user': lambda: select(Report).join(Assessment).filter(Assessment.user_id == 1),
+    'report body': lambda: select(ReportBody).filter_by(digest='0' * 64),
+    'payment by intent': lambda: select(Payment).filter_by(stripe_payment_intent_id='pi_1'),
+    'payment for user': lambda: select(Payment).filter_by(
+        user_id=1, assessment_type='premium', status='succeeded').order_by(Payment.id).limit(1),
+    'entitlement for user': lambda: select(Entitlement.payment_id).filter_by(user_id=1, product='premium'),
+    'recent users': lambda: select(User).order_by(User.created_at.desc().nulls_last(), User.id.desc()).limit(20),
+    'recent assessments': lambda: select(Assessment).order_by(Assessment.created_at.desc().nulls_last(), Assessment.id.desc()).limit(20),
+    'recent payments': lambda: select(Payment).order_by(Payment.created_at.desc().nulls_last(), Payment.id.desc()).limit(20),
+    'recent reports': lambda: select(Report).order_by(Report.generated_at.desc().nulls_last(), Report.id.desc()).limit(20),
+    'next jobs': lambda: select(Job).filter(
+        or_(Job.status == 'queued', Job.status == 'running'), Job.run_after <= _now
+    ).order_by(Job.run_after, Job.id).limit(10),
+}
+
+# SQLite reports a full scan as "SCAN <table>" ("SCAN TABLE <table>" before 3.36)
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(?: AS \S+)?$')
+_POSTGRESQL_FULL_SCAN = re.compile(r'Seq Scan on (\S+)')
+
+
+def _explain_sqlite(connection, statement, params):
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', params).all()
+    return [row[-1] for row in rows]
+
+
+def _explain_postgresql(connection, statement, params):
+    # Tiny tables are cheaper to scan, so force the planner to show the index it would use
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    rows = connection.exec_driver_sql(f'EXPLAIN {statement}', params).all()
+    return [row[0] for row in rows]
+
+
+# Dialects whose plans can be read, by dialect name
+EXPLAINERS = {
+    'sqlite': _explain_sqlite,
+    'postgresql': _explain_postgresql,
+}
+
+
+def explain(connection, query):
+    """Return the plan lines for a query on the connection's database (one of EXPLAINERS)"""
+    dialect = connection.dialect
+    compiled = query.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    if dialect.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    return EXPLAINERS[dialect.name](connection, str(compiled), params)
+
+
+def full_scans(dialect_name, plan):
+    """Tables the plan reads with a full scan"""
+    pattern = _SQLITE_FULL_SCAN if dialect_name == 'sqlite' else _POSTGRESQL_FULL_SCAN
+    tables = []
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+def check_plans(echo=print):
+    """EXPLAIN every hot query and return the names of those that scan a table.
+
+    Returns None, having checked nothing, on a database not in EXPLAINERS.
+    """
+    dialect_name = db.engine.dialect.name
+    if dialect_name not in EXPLAINERS:
+        echo(f'SKIP query plans are not checked on {dialect_name}, only on {" and ".join(EXPLAINERS)}')
+        return None
+
+    failures = []
+    with db.engine.connect() as connection:
+        for name, build in HOT_QUERIES.items():
+            with connection.begin():
+                plan = explain(connection, build())
+            scans = full_scans(connection.dialect.name, plan)
+            if scans:
+                failures.append(name)
+                echo(f'FAIL {name}: full scan of {", ".join(scans)}')
+                for line in plan:
+                    echo(f'    {line}')
+            else:
+                echo(f'ok   {name}')
+    return failures
@@ -0,0 +1,147 @@
+"""Per-request SQL statement counting, N+1 detection and query budgets.
+
+Every statement executed through SQLAlchemy is counted and timed by each
+active QueryStats: one per request, plus any opened by track_queries() or
+query_budget. At the end of a request, statement shapes (the SQL with IN
+lists collapsed) repeated QUERY_REPEAT_THRESHOLD times or more are logged as
+possible N+1 queries, and in debug mode (or with QUERY_STATS_HEADER) the
+totals are sent in X-Query-Count and X-Query-Time response headers.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ContextDecorator, contextmanager
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_listening = False
+
+# A parenthesised list of two or more bind placeholders (?, %(name)s or $1)
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+))+\s*\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by query_budget when QUERY_BUDGET_STRICT is set"""
+
+
+class QueryStats:
+    """Statement count, time and shapes seen while active"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """(shape, count) for statement shapes executed at least `threshold` times"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def statement_shape(statement):
+    """Normalise a statement so executions differing only in IN list length match"""
+    return _PLACEHOLDER_LIST.sub('(...)', ' '.join(statement.split()))
+
+
+def _active_stats():
+    if not hasattr(_local, 'stats'):
+        _local.stats = []
+    return _local.stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_started'].pop()
+    for stats in _active_stats():
+        stats.record(statement, duration)
+
+
+@contextmanager
+def track_queries():
+    """Count the statements executed inside the block"""
+    stats = QueryStats()
+    _active_stats().append(stats)
+    try:
+        yield stats
+    finally:
+        _active_stats().remove(stats)
+
+
+class query_budget(ContextDecorator):
+    """Context manager or view decorator allowing at most `max_queries` statements.
+
+    Exceeding the budget raises QueryBudgetExceeded when QUERY_BUDGET_STRICT is
+    set (as in tests) and logs a warning otherwise.
+    """
+
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self.stats = None
+
+    def _recreate_cm(self):
+        # A fresh instance per decorated call, so concurrent requests don't share counters
+        return query_budget(self.max_queries)
+
+    def __enter__(self):
+        self.stats = QueryStats()
+        _active_stats().append(self.stats)
+        return self.stats
+
+    def __exit__(self, exc_type, exc, tb):
+        _active_stats().remove(self.stats)
+        if exc_type is not None or self.stats.count <= self.max_queries:
+            return False
+
+        message = f'{self.stats.count} queries executed, budget is {self.max_queries}'
+        if current_app.config['QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message)
+        where = request.endpoint if has_request_context() else 'block'
+        logger.warning(f"Query budget exceeded in {where}: {message}")
+        return False
+
+
+def init_query_stats(app):
+    """Count statements per request and report them after each response"""
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+        _active_stats().append(g.query_stats)
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        for shape, n in stats.repeated(app.config['QUERY_REPEAT_THRESHOLD']):
+            logger.warning(f"Possible N+1 in {request.method} {request.path}: {n} x {shape[:200]}")
+
+        if app.debug or app.config['QUERY_STATS_HEADER']:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time'] = f'{stats.duration * 1000:.1f}ms'
+        return response
+
+    @app.teardown_request
+    def stop_query_stats(exc):
+        stats = g.pop('query_stats', None)
+        if stats is not None and stats in _active_stats():
+            _active_stats().remove(stats)
@@ -0,0 +1,104 @@
+"""Read replica routing.
+
+With REPLICA_DATABASE_URL set, the replica is configured as the 'replica'
+bind, and db.session is a RoutingSession. Inside use_replica() (or for any
+GET to the admin blueprint), plain SELECTs go to the replica. Everything else
+stays on the primary: flushes, DML, SELECT ... FOR UPDATE, and all
+user-facing requests, which must read their own writes.
+
+The replica is used only while its lag is at most REPLICA_MAX_LAG seconds.
+Lag is checked at most every REPLICA_LAG_CHECK_INTERVAL seconds per process.
+On PostgreSQL it is the replay delay reported by the standby. On other
+databases it is how far the replica's newest assessment trails the
+primary's. An unreachable replica counts as lagging, so reads fall back to
+the primary.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import select, func, text
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+_POSTGRESQL_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() IS NULL"
+    " OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+# (checked at, whether the replica was usable)
+_last_check = None
+
+
+def _newest_assessment(engine):
+    from app.models import Assessment
+    with engine.connect() as connection:
+        return connection.execute(select(func.max(Assessment.created_at))).scalar()
+
+
+def measure_lag(primary, replica):
+    """Seconds the replica is behind the primary"""
+    if replica.dialect.name == 'postgresql':
+        with replica.connect() as connection:
+            return float(connection.execute(_POSTGRESQL_LAG).scalar() or 0)
+
+    newest = _newest_assessment(primary)
+    if newest is None:
+        return 0.0
+    replica_newest = _newest_assessment(replica)
+    if replica_newest is None:
+        return float('inf')
+    return max((newest - replica_newest).total_seconds(), 0.0)
+
+
+def replica_usable(engines):
+    """Whether reads may go to the replica; rechecked at most every REPLICA_LAG_CHECK_INTERVAL seconds"""
+    global _last_check
+    if REPLICA_BIND not in engines:
+        return False
+    now = time.monotonic()
+    if _last_check is not None and now - _last_check[0] < current_app.config['REPLICA_LAG_CHECK_INTERVAL']:
+        return _last_check[1]
+
+    try:
+        lag = measure_lag(engines[None], engines[REPLICA_BIND])
+    except Exception as e:
+        logger.warning(f"Read replica unavailable, reading from the primary: {e}")
+        usable = False
+    else:
+        usable = lag <= current_app.config['REPLICA_MAX_LAG']
+        if not usable:
+            logger.warning(f"Read replica is {lag:.1f}s behind, reading from the primary")
+    _last_check = (now, usable)
+    return usable
+
+
+def _is_plain_select(clause):
+    return (clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+class RoutingSession(Session):
+    """Session that sends plain SELECTs to the replica while use_replica routing is on"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get('use_replica') and not self._flushing
+                and _is_plain_select(clause) and replica_usable(self._db.engines)):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def use_replica():
+    """Route db.session's plain reads to the replica inside the block"""
+    from app import db
+    previous = db.session.info.get('use_replica', False)
+    db.session.info['use_replica'] = True
+    try:
+        yield
+    finally:
+        db.session.info['use_replica'] = previous
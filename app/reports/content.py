@@ -0,0 +1,140 @@
+"""Structured report building and render-on-read.
+
+A report's deterministic part (scores, levels, strengths, recommendations) is
+a pure function of (instrument, SCORING_VERSION, answer vector). It is stored
+once in the content-addressed ReportBody table under the sha256 of that key,
+and Report rows reference it by digest alongside their summary columns and any
+per-report data (population percentiles, which change over time).
+
+Reports are rendered to HTML through Jinja templates when viewed. Rendered
+output is kept in a per-process LRU cache keyed by report id, generation time
+and TEMPLATE_VERSION (SQLite can hand a regenerated report the id of a deleted
+one), and report bodies in a second LRU keyed by digest.
+"""
+import hashlib
+import numpy as np
+from flask import current_app
+from markupsafe import Markup
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.cache import LRUCache
+from app.models import ReportBody
+from app.assessment.premium_questions import CATEGORY_DESCRIPTIONS
+
+# Bump whenever scoring or insight rules change so new reports get new bodies
+SCORING_VERSION = 1
+
+# Bump whenever a report template changes so cached renders are not reused
+TEMPLATE_VERSION = 1
+
+REPORT_TEMPLATES = {
+    'simple': 'reports/_simple_report.html',
+    'premium': 'reports/_premium_report.html',
+}
+
+_render_cache = None
+_body_cache = None
+
+
+def report_digest(assessment_type, answers):
+    """Content address of the report body for an answer vector"""
+    key = f'{assessment_type}:{SCORING_VERSION}:'.encode() + np.asarray(answers, dtype=np.uint8).tobytes()
+    return hashlib.sha256(key).hexdigest()
+
+
+def build_report_body(assessment_type, answers):
+    """Score an answer vector into the deterministic report body"""
+    if assessment_type == 'premium':
+        from app.assessment.premium_scoring import build_comprehensive_report
+        return build_comprehensive_report(answers)
+
+    from app.assessment.scoring import build_simple_report
+    return build_simple_report(answers)
+
+
+def report_fields(body, norms=None):
+    """Summary columns and per-report data for a Report referencing `body`"""
+    if body['instrument'] == 'premium':
+        from app.assessment.premium_scoring import get_category_interpretation
+        category = get_category_interpretation(None, body['overall_score'])['level']
+        percentiles = norms.percentile_ranks(body['scores']) if norms else {}
+        return {
+            'overall_score': body['overall_score'],
+            'category': category,
+            'data': {'percentiles': percentiles} if percentiles else None
+        }
+
+    return {'overall_score': body['spike_factor'], 'category': body['category'], 'data': None}
+
+
+def get_body_cache():
+    global _body_cache
+    if _body_cache is None:
+        _body_cache = LRUCache(current_app.config['REPORT_BODY_CACHE_SIZE'])
+    return _body_cache
+
+
+def get_body(digest):
+    """Return a report body by digest from the cache or the database"""
+    cache = get_body_cache()
+    body = cache.get(digest)
+    if body is None:
+        row = db.session.get(ReportBody, digest)
+        if row is None:
+            return None
+        body = row.data
+        cache.set(digest, body)
+    return body
+
+
+def get_or_create_body(assessment_type, answers):
+    """Return (digest, body) for an answer vector, scoring it only if no identical report exists"""
+    digest = report_digest(assessment_type, answers)
+    body = get_body(digest)
+    if body is None:
+        body = build_report_body(assessment_type, answers)
+        try:
+            # Savepoint, so losing a race with an identical insert keeps the outer transaction
+            with db.session.begin_nested():
+                db.session.add(ReportBody(digest=digest, data=body))
+        except IntegrityError:
+            pass
+        get_body_cache().set(digest, body)
+    return digest, body
+
+
+def build_report(assessment_type, answers, norms=None):
+    """Return the Report column values for an answer vector"""
+    digest, body = get_or_create_body(assessment_type, answers)
+    return dict(report_fields(body, norms), body_digest=digest)
+
+
+def report_data(report):
+    """Full structured data for a report: its shared body plus per-report data"""
+    if report.body_digest is None:
+        return report.data
+    return dict(get_body(report.body_digest), **(report.data or {}))
+
+
+def get_render_cache():
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = LRUCache(current_app.config['REPORT_RENDER_CACHE_SIZE'])
+    return _render_cache
+
+
+def render_report(report):
+    """Render a report's HTML, serving repeat views from the cache"""
+    cache = get_render_cache()
+    key = (report.id, report.generated_at, TEMPLATE_VERSION)
+    html = cache.get(key)
+    if html is None:
+        data = report_data(report)
+        if data is None:
+            # Legacy report stored as a pre-rendered HTML blob
+            html = Markup(report.content)
+        else:
+            template = current_app.jinja_env.get_template(REPORT_TEMPLATES[data['instrument']])
+            html = Markup(template.render(data=data, category_descriptions=CATEGORY_DESCRIPTIONS))
+        cache.set(key, html)
+    return html
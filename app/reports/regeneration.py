@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import bindparam, insert, update
+from app import db
+from app.models import Assessment, Report, ReportBody, JobCheckpoint
+from app.assessment.answers import UPSERT_INSERTS, load_answer_vectors, unpack_answers
+from app.assessment.norms import get_norms
+from app.assessment.scoring_engine import get_plan
+from app.reports.content import SCORING_VERSION, report_digest, build_report_body, report_fields
+from app.stats import adjust_counters
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'reports-regenerate'
+FINGERPRINT_NAME = 'reports-scoring-fingerprint'
+
+# Answer vectors scored per instrument to fingerprint the scoring rules
+FINGERPRINT_PROBES = 64
+# Names how the probe vectors are derived; fingerprints from another probe set are replaced, not compared
+FINGERPRINT_PROBE_SET = 'sha256'
+
+
+class ScoringVersionError(RuntimeError):
+    """Scoring output changed but SCORING_VERSION was not bumped"""
+
+
+def _probe_answers(instrument, count):
+    """`count` fixed answer vectors (values 0-5) for an instrument, derived with sha256"""
+    question_count = len(get_plan(instrument).question_ids)
+    probes = []
+    for probe in range(count):
+        stream = b''
+        block = 0
+        while len(stream) < question_count:
+            stream += hashlib.sha256(f'{instrument}:{probe}:{block}'.encode()).digest()
+            block += 1
+        probes.append(bytes(value % 6 for value in stream[:question_count]))
+    return probes
+
+
+def scoring_fingerprint():
+    """Hash of the report bodies built for a fixed set of answer vectors"""
+    fingerprint = hashlib.sha256()
+    for instrument in ['simple', 'premium']:
+        for vector in _probe_answers(instrument, FINGERPRINT_PROBES):
+            body = build_report_body(instrument, unpack_answers(vector))
+            fingerprint.update(json.dumps(body, sort_keys=True, default=str).encode())
+    return fingerprint.hexdigest()
+
+
+def check_scoring_version():
+    """Record the scoring fingerprint, refusing to continue if the rules changed under the same SCORING_VERSION.
+
+    Report bodies are shared by digest, and the digest only covers SCORING_VERSION,
+    so regenerating after a rule change without a bump would re-link the stale bodies.
+    """
+    checkpoint = JobCheckpoint.get(FINGERPRINT_NAME)
+    prefix = f'{SCORING_VERSION}:{FINGERPRINT_PROBE_SET}:'
+    recorded = prefix + scoring_fingerprint()
+    if checkpoint.position and checkpoint.position != recorded and checkpoint.position.startswith(prefix):
+        db.session.rollback()
+        raise ScoringVersionError(
+            f'Scoring output changed but SCORING_VERSION is still {SCORING_VERSION}; '
+            'bump it in app/reports/content.py so the changed reports get new bodies'
+        )
+    checkpoint.position = recorded
+    db.session.commit()
+
+def _body_task(task):
+    """Process pool entry point: (digest, type, packed answers) -> (digest, body, error)"""
+    digest, assessment_type, answer_vector = task
+    try:
+        return digest, build_report_body(assessment_type, unpack_answers(answer_vector)), None
+    except Exception as e:
+        return digest, None, str(e)
+
+
+def _load_chunk(after_id, chunk_size, assessment_type=None):
+    """Load the next chunk of completed assessments with their packed answers"""
+    query = db.session.query(Assessment.id, Assessment.type, Assessment.answer_vector).filter(
+        Assessment.completed == True,
+        Assessment.id > after_id
+    )
+    if assessment_type:
+        query = query.filter(Assessment.type == assessment_type)
+    assessments = query.order_by(Assessment.id).limit(chunk_size).all()
+    if not assessments:
+        return []
+
+    vectors = load_answer_vectors(assessments)
+    return [(assessment.id, assessment.type, vectors[assessment.id]) for assessment in assessments]
+
+
+def regenerate_reports(chunk_size=500, workers=None, assessment_type=None,
+                       keep_previous=False, restart=False, echo=print):
+    """Regenerate reports for all completed assessments, resuming from the last checkpoint.
+
+    Each chunk's reports and the checkpoint advance are committed in the same
+    transaction, so a killed run never redoes or half-applies a chunk. A run that
+    finishes clears the checkpoint, so the next one starts from the beginning.
+
+    Existing reports are updated in place, keeping their ids (and so their
+    /reports/view links); an assessment without one gets a new report. With
+    `keep_previous` every assessment gets a new report alongside the old ones.
+    Bodies are inserted with ON CONFLICT DO NOTHING where the database supports
+    it, so a web request storing the same body meanwhile does not fail the chunk.
+    """
+    check_scoring_version()
+
+    name = CHECKPOINT_NAME if not assessment_type else f'{CHECKPOINT_NAME}-{assessment_type}'
+    checkpoint = JobCheckpoint.get(name)
+    if restart or checkpoint.position is None:
+        checkpoint.position = '0'
+        db.session.commit()
+
+    after_id = int(checkpoint.position)
+    if after_id:
+        echo(f'Resuming after assessment {after_id}')
+
+    total = scored = failed = 0
+    started = time.monotonic()
+    norms = get_norms()
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        while True:
+            tasks = _load_chunk(after_id, chunk_size, assessment_type)
+            if not tasks:
+                break
+
+            # Identical answer vectors share one body, so only unseen digests are scored
+            digests = {assessment_id: report_digest(instrument, unpack_answers(answer_vector))
+                       for assessment_id, instrument, answer_vector in tasks}
+            bodies = dict(db.session.query(ReportBody.digest, ReportBody.data).filter(
+                ReportBody.digest.in_(set(digests.values()))
+            ))
+            missing = {}
+            for assessment_id, instrument, answer_vector in tasks:
+                digest = digests[assessment_id]
+                if digest not in bodies:
+                    missing[digest] = (digest, instrument, answer_vector)
+
+            if pool:
+                results = list(pool.map(_body_task, missing.values(), chunksize=16))
+            else:
+                results = [_body_task(task) for task in missing.values()]
+
+            new_bodies = []
+            for digest, body, error in results:
+                if error:
+                    logger.error(f"Failed to build report body {digest}: {error}")
+                    continue
+                bodies[digest] = body
+                new_bodies.append({'digest': digest, 'data': body})
+            if new_bodies:
+                upsert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+                statement = upsert(ReportBody).on_conflict_do_nothing(index_elements=['digest']) if upsert else insert(ReportBody)
+                db.session.execute(statement, new_bodies)
+
+            generated_at = datetime.utcnow()
+            new_reports = []
+            for assessment_id, _, _ in tasks:
+                digest = digests[assessment_id]
+                if digest not in bodies:
+                    failed += 1
+                    logger.error(f"Failed to regenerate report for assessment {assessment_id}")
+                    continue
+                new_reports.append(dict(report_fields(bodies[digest], norms), body_digest=digest,
+                                        assessment_id=assessment_id, generated_at=generated_at))
+
+            existing = set()
+            if new_reports and not keep_previous:
+                existing = {assessment_id for assessment_id, in db.session.query(Report.assessment_id).filter(
+                    Report.assessment_id.in_([report['assessment_id'] for report in new_reports])
+                ).distinct()}
+            if existing:
+                db.session.execute(
+                    update(Report.__table__).where(Report.assessment_id == bindparam('b_assessment_id')).values(
+                        body_digest=bindparam('b_body_digest'),
+                        overall_score=bindparam('b_overall_score'),
+                        category=bindparam('b_category'),
+                        data=bindparam('b_data'),
+                        generated_at=bindparam('b_generated_at')
+                    ),
+                    [{f'b_{key}': value for key, value in report.items()}
+                     for report in new_reports if report['assessment_id'] in existing]
+                )
+            inserted = [report for report in new_reports if report['assessment_id'] not in existing]
+            if inserted:
+                db.session.execute(insert(Report), inserted)
+            # Bulk statements skip the counter hooks, so the reports counter is adjusted here
+            adjust_counters({'reports': len(inserted)})
+
+            after_id = tasks[-1][0]
+            checkpoint = JobCheckpoint.get(name)
+            checkpoint.position = str(after_id)
+            db.session.commit()
+
+            total += len(new_reports)
+            scored += len(new_bodies)
+            elapsed = time.monotonic() - started
+            echo(f'Regenerated {total} reports ({scored} newly scored, {failed} failed) '
+                 f'through assessment {after_id}, {total / elapsed:.0f} reports/s')
+    finally:
+        if pool:
+            pool.shutdown()
+
+    checkpoint = JobCheckpoint.get(name)
+    checkpoint.position = None
+    db.session.commit()
+    echo(f'Done: {total} reports regenerated, {failed} failed')
+    return total, failed
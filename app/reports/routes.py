@@ -1,16 +1,75 @@
-from flask import render_template, flash, redirect, url_for
+import time
+from flask import render_template, flash, redirect, url_for, request, jsonify, current_app
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from app import db
 from app.reports import bp
-from app.models import Report
+from app.models import Report, Assessment, Job
+from app.reports.tasks import report_job_key
+from app.query_stats import query_budget
+from app.long_poll import long_poll_wait
 
 @bp.route('/view/<int:report_id>')
 @login_required
+@query_budget(4)
 def view(report_id):
-    report = Report.query.get_or_404(report_id)
+    # Load the assessment with the report, since ownership is checked on it
+    report = Report.query.options(joinedload(Report.assessment)).get_or_404(report_id)
 
     # Check if user owns this report
     if report.assessment.user_id != current_user.id:
         flash('Access denied')
         return redirect(url_for('dashboard.index'))
 
-    return render_template('reports/view.html', report=report)
\ No newline at end of file
+    return render_template('reports/view.html', report=report)
+
+@bp.route('/generating/<int:assessment_id>')
+@login_required
+def generating(assessment_id):
+    """Waiting page shown while a report is generated in the background"""
+    assessment = Assessment.query.get_or_404(assessment_id)
+
+    if assessment.user_id != current_user.id:
+        flash('Access denied')
+        return redirect(url_for('dashboard.index'))
+
+    report = assessment.reports.first()
+    if report:
+        return redirect(url_for('reports.view', report_id=report.id))
+
+    return render_template('reports/generating.html', title='Generating Report', assessment=assessment)
+
+def _report_status(assessment_id):
+    """Return (status, report) for an assessment's background report"""
+    report = Report.query.filter_by(assessment_id=assessment_id).first()
+    if report:
+        return 'ready', report
+
+    job = Job.query.filter_by(key=report_job_key(assessment_id)).first()
+    if job and job.status == 'failed':
+        return 'failed', None
+    return 'generating', None
+
+@bp.route('/status/<int:assessment_id>')
+@login_required
+def status(assessment_id):
+    """JSON report status; pass ?wait=<seconds> to long-poll until the report exists"""
+    assessment = Assessment.query.get_or_404(assessment_id)
+
+    if assessment.user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    wait = long_poll_wait(current_app.config['REPORT_STATUS_MAX_WAIT'])
+    deadline = time.monotonic() + wait
+    while True:
+        report_status, report = _report_status(assessment_id)
+        if report_status != 'generating' or time.monotonic() >= deadline:
+            break
+        # End the transaction so the next check sees the worker's commit
+        db.session.rollback()
+        time.sleep(0.5)
+
+    response_data = {'status': report_status}
+    if report:
+        response_data['report_url'] = url_for('reports.view', report_id=report.id)
+    return jsonify(response_data)
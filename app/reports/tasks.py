@@ -0,0 +1,39 @@
+from app import db
+from app.jobs import job_handler
+from app.models import Assessment, Report
+from app.assessment.answers import get_answers
+from app.assessment.norms import get_norms
+from app.reports.content import build_report, get_body
+
+
+def report_job_key(assessment_id):
+    return f'report:{assessment_id}'
+
+
+def generate_report_for(assessment):
+    """Build, store and commit the report for a completed assessment"""
+    answers = get_answers(assessment)
+    norms = get_norms() if assessment.type == 'premium' else None
+    fields = build_report(assessment.type, answers, norms)
+
+    report = Report(assessment_id=assessment.id, **fields)
+    db.session.add(report)
+    db.session.commit()
+
+    # Add this assessment to the norms only once it is committed
+    if norms:
+        norms.record(get_body(fields['body_digest'])['scores'])
+
+    return report
+
+
+@job_handler('generate_report')
+def generate_report_job(payload):
+    """Background job: generate the report for a completed assessment"""
+    assessment = db.session.get(Assessment, payload['assessment_id'])
+    if assessment is None or not assessment.completed:
+        return
+
+    # Idempotent: a retried or duplicate job leaves the existing report alone
+    if assessment.reports.first() is None:
+        generate_report_for(assessment)
@@ -0,0 +1,151 @@
+"""SQLite production profile.
+
+Every new SQLite connection is switched to WAL, so readers no longer block the
+writer. It also gets synchronous=NORMAL (fsync at checkpoints instead of every
+commit, which is safe with WAL) and a busy timeout, so a writer waits for the
+lock instead of failing with "database is locked". Larger mmap and page cache
+sizes are set too.
+
+SQLite allows one writer at a time. With SQLITE_WRITE_LOCK set, writes from
+every worker process queue on an exclusive file lock next to the database
+instead of contending for SQLite's lock. The lock is taken at a connection's
+first write statement and released when its transaction ends.
+
+`flask sqlite bench` measures answer-commit throughput with N concurrent
+worker processes against a scratch database, with and without the profile.
+"""
+import fcntl
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from app import db
+
+# Statements that never take SQLite's write lock
+_READ_ONLY = re.compile(r'\s*(SELECT|PRAGMA|EXPLAIN|WITH)\b', re.IGNORECASE)
+
+
+def apply_pragmas(dbapi_connection, config):
+    """Set the production pragmas on a new DBAPI connection"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+    cursor.execute(f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}")
+    cursor.close()
+
+
+def _release_write_lock(info):
+    lock_file = info.pop('write_lock', None)
+    if lock_file is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _install_write_lock(engine, lock_path):
+    def acquire(conn, cursor, statement, parameters, context, executemany):
+        if 'write_lock' in conn.info or _READ_ONLY.match(statement):
+            return
+        lock_file = open(lock_path, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        conn.info['write_lock'] = lock_file
+
+    # Released as the commit or rollback is issued; the busy timeout covers the rest of it
+    event.listen(engine, 'before_cursor_execute', acquire)
+    event.listen(engine, 'commit', lambda conn: _release_write_lock(conn.info))
+    event.listen(engine, 'rollback', lambda conn: _release_write_lock(conn.info))
+    # Connections returned to the pool or discarded mid-transaction
+    event.listen(engine, 'checkin', lambda dbapi_connection, record: _release_write_lock(record.info))
+
+
+def init_sqlite_profile(app):
+    """Apply the SQLite profile to the app's SQLite engines"""
+    if not app.config['SQLITE_PROFILE']:
+        return
+
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    for engine in engines:
+        if engine.dialect.name != 'sqlite':
+            continue
+        event.listen(engine, 'connect', lambda dbapi_connection, record: apply_pragmas(dbapi_connection, app.config))
+
+        database = engine.url.database
+        if app.config['SQLITE_WRITE_LOCK'] and database and database != ':memory:':
+            _install_write_lock(engine, os.path.abspath(database) + '.write.lock')
+
+
+def _bench_worker(config_class, commits, start, results):
+    from app import create_app
+    from app.models import User, Assessment
+    from app.assessment.answers import init_answer_storage, save_answer
+    from app.assessment.scoring_engine import get_plan
+
+    app = create_app(config_class)
+    with app.app_context():
+        user = User(email=f'bench-{os.getpid()}@example.com')
+        user.set_password(os.urandom(8).hex())
+        db.session.add(user)
+        db.session.flush()
+        assessment = Assessment(user_id=user.id, type='premium')
+        init_answer_storage(assessment)
+        db.session.add(assessment)
+        db.session.commit()
+
+        question_ids = get_plan('premium').question_ids
+        done = failed = 0
+        # Time only the commits, not app start-up
+        start.wait()
+        for i in range(commits):
+            try:
+                save_answer(assessment, question_ids[i % len(question_ids)], str(i % 5 + 1))
+                db.session.commit()
+                done += 1
+            except OperationalError:
+                db.session.rollback()
+                failed += 1
+        results.put((done, failed))
+
+
+def benchmark_answer_commits(workers, commits, profile=True, write_lock=False, echo=print):
+    """Time `workers` processes each committing `commits` answers to a scratch SQLite database"""
+    from config import Config
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as directory:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(directory, 'bench.db')
+            SQLITE_PROFILE = profile
+            SQLITE_WRITE_LOCK = write_lock
+            SQLALCHEMY_BINDS = {}
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            db.engine.dispose()
+
+        context = multiprocessing.get_context('fork')
+        start = context.Barrier(workers + 1)
+        results = context.Queue()
+        processes = [context.Process(target=_bench_worker, args=(BenchConfig, commits, start, results))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        start.wait()
+        started = time.monotonic()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - started
+
+    done = sum(n for n, _ in outcomes)
+    failed = sum(n for _, n in outcomes)
+    label = ('profile' + (' + write lock' if write_lock else '')) if profile else 'default'
+    echo(f'{label}: {workers} workers, {done} commits in {elapsed:.2f}s '
+         f'({done / elapsed:.0f} commits/s), {failed} failed with "database is locked"')
+    return done, failed, elapsed
@@ -0,0 +1,158 @@
+"""Incrementally maintained site statistics for the admin dashboard.
+
+StatCounter holds one row per statistic. Mapper hooks on User, Assessment,
+Payment and Report add the change each insert, update or delete makes to the counters,
+using the flush's own connection, so counters commit or roll back together
+with the rows they describe. Bulk statements that bypass the ORM unit of
+work do not fire the hooks; they call adjust_counters with their row counts,
+and `flask stats reconcile` recomputes every counter from the tables.
+"""
+from sqlalchemy import event, func, case, update, insert
+from sqlalchemy.orm.attributes import get_history
+from app import db
+from app.models import User, Assessment, Payment, Report, StatCounter
+
+_registered = False
+
+
+def _user_counts(values):
+    return {'users': 1}
+
+
+def _assessment_counts(values):
+    return {
+        'assessments': 1,
+        f"assessments_{values['type']}": 1,
+        'assessments_completed': 1 if values['completed'] else 0,
+    }
+
+
+def _report_counts(values):
+    return {'reports': 1}
+
+
+def _payment_counts(values):
+    succeeded = values['status'] == 'succeeded'
+    return {
+        'payments': 1,
+        'payments_succeeded': 1 if succeeded else 0,
+        'revenue_cents': values['amount'] if succeeded else 0,
+    }
+
+
+# model -> (columns the counts depend on, function of those column values -> counts)
+COUNTED_MODELS = {
+    User: ([], _user_counts),
+    Assessment: (['type', 'completed'], _assessment_counts),
+    Payment: (['status', 'amount'], _payment_counts),
+    Report: ([], _report_counts),
+}
+
+
+def _values(target, columns, before=False):
+    """Column values after the flush, or before it when `before` is set"""
+    values = {}
+    for column in columns:
+        history = get_history(target, column)
+        if before and history.deleted:
+            values[column] = history.deleted[0]
+        else:
+            values[column] = getattr(target, column)
+    return values
+
+
+def _apply(connection, deltas):
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        result = connection.execute(
+            update(StatCounter).where(StatCounter.name == name).values(value=StatCounter.value + delta)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(StatCounter).values(name=name, value=delta))
+
+
+def adjust_counters(deltas):
+    """Apply counter deltas for a bulk statement that bypassed the hooks, in the caller's transaction"""
+    _apply(db.session.connection(), deltas)
+
+
+def _counter_hook(change):
+    def hook(mapper, connection, target):
+        columns, counts = COUNTED_MODELS[mapper.class_]
+        deltas = {}
+        if change in ('insert', 'update'):
+            for name, n in counts(_values(target, columns)).items():
+                deltas[name] = deltas.get(name, 0) + n
+        if change in ('update', 'delete'):
+            for name, n in counts(_values(target, columns, before=True)).items():
+                deltas[name] = deltas.get(name, 0) - n
+        _apply(connection, deltas)
+    return hook
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def init_stat_counters():
+    """Register the counter hooks on the counted models (once per process)"""
+    global _registered
+    if _registered:
+        return
+    for model, (columns, _) in COUNTED_MODELS.items():
+        for change in ('insert', 'update', 'delete'):
+            event.listen(model, f'after_{change}', _counter_hook(change))
+        for column in columns:
+            # Load the old value when an expired attribute is set, so updates know what they replace
+            event.listen(getattr(model, column), 'set', _keep_old_value, active_history=True)
+    _registered = True
+
+
+def get_counters():
+    """All counters as a dict; missing counters read as 0"""
+    return dict(db.session.query(StatCounter.name, StatCounter.value).all())
+
+
+def compute_counters():
+    """Recompute every counter from the tables"""
+    counters = {'users': db.session.query(func.count(User.id)).scalar()}
+
+    total, completed = db.session.query(
+        func.count(Assessment.id),
+        func.count(case((Assessment.completed == True, 1)))
+    ).one()
+    counters.update(assessments=total, assessments_completed=completed)
+    for assessment_type, n in db.session.query(Assessment.type, func.count(Assessment.id)).group_by(Assessment.type):
+        counters[f'assessments_{assessment_type}'] = n
+
+    total, succeeded, revenue = db.session.query(
+        func.count(Payment.id),
+        func.count(case((Payment.status == 'succeeded', 1))),
+        func.coalesce(func.sum(case((Payment.status == 'succeeded', Payment.amount), else_=0)), 0)
+    ).one()
+    counters.update(payments=total, payments_succeeded=succeeded, revenue_cents=revenue)
+
+    counters['reports'] = db.session.query(func.count(Report.id)).scalar()
+    return counters
+
+
+def reconcile_counters(echo=print):
+    """Overwrite the counters with freshly computed values, reporting any drift"""
+    # Lock the counters first so writers committing meanwhile apply their deltas on top of the result
+    rows = {counter.name: counter for counter in StatCounter.query.with_for_update()}
+    expected = compute_counters()
+    drift = 0
+    for name in sorted(set(expected) | set(rows)):
+        value = expected.get(name, 0)
+        counter = rows.get(name)
+        if counter is None:
+            counter = StatCounter(name=name, value=0)
+            db.session.add(counter)
+        if counter.value != value:
+            drift += 1
+            echo(f'{name}: {counter.value} -> {value}')
+            counter.value = value
+    db.session.commit()
+    echo(f'Done: {len(expected)} counters reconciled, {drift} corrected')
+    return drift
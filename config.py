@@ -8,6 +8,20 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///spike_factor.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Read replica for admin, analytics and export reads (see app.replica)
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    SQLALCHEMY_BINDS = {'replica': REPLICA_DATABASE_URL} if REPLICA_DATABASE_URL else {}
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG') or 30)  # seconds
+    REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL') or 5)  # seconds
+
+    # SQLite connection profile (see app.sqlite_profile); ignored on other databases
+    SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'true').lower() in ['true', 'on', '1']
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)  # milliseconds
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE = int(os.environ.get('SQLITE_CACHE_SIZE') or -64000)  # negative: KiB
+    # Queue writes from all worker processes on a file lock next to the database
+    SQLITE_WRITE_LOCK = os.environ.get('SQLITE_WRITE_LOCK', 'false').lower() in ['true', 'on', '1']
+
     # Email configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
@@ -19,7 +33,71 @@ class Config:
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    # Stripe API client: another API server (e.g. the fake one), deadlines, retries and connection pool
+    STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')
+    STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT') or 10)  # seconds
+    STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT') or 3)  # seconds
+    STRIPE_MAX_NETWORK_RETRIES = int(os.environ.get('STRIPE_MAX_NETWORK_RETRIES') or 1)
+    STRIPE_POOL_SIZE = int(os.environ.get('STRIPE_POOL_SIZE') or 10)
+    # Checkout reuses an unpaid PaymentIntent (client secret cached per worker) for this many seconds
+    PAYMENT_INTENT_REUSE_WINDOW = int(os.environ.get('PAYMENT_INTENT_REUSE_WINDOW') or 3600)
+    PAYMENT_INTENT_CACHE_SIZE = int(os.environ.get('PAYMENT_INTENT_CACHE_SIZE') or 10000)
+
+    # Answer storage for new assessments: 'rows' (one Response per question) or 'packed'
+    ANSWER_STORAGE = os.environ.get('ANSWER_STORAGE') or 'rows'
+
+    # Premium questions per page: '1' (one per page), 'category' or a block size
+    PREMIUM_PAGE_SIZE = os.environ.get('PREMIUM_PAGE_SIZE') or '1'
+
+    # Per-process cache of granted premium entitlements
+    ENTITLEMENT_CACHE_TTL = int(os.environ.get('ENTITLEMENT_CACHE_TTL') or 60)
+    ENTITLEMENT_CACHE_SIZE = int(os.environ.get('ENTITLEMENT_CACHE_SIZE') or 10000)
+
+    # Signed-in user identities cached per process (see app.identity)
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 30)
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 10000)
+
+    # Population norms for premium percentile ranks (defaults to instance/norms.dat)
+    NORMS_FILE = os.environ.get('NORMS_FILE')
+    NORMS_MIN_SAMPLE = int(os.environ.get('NORMS_MIN_SAMPLE') or 30)
+
+    # Rendered reports and deduplicated report bodies kept in each worker's LRU caches
+    REPORT_RENDER_CACHE_SIZE = int(os.environ.get('REPORT_RENDER_CACHE_SIZE') or 1024)
+    REPORT_BODY_CACHE_SIZE = int(os.environ.get('REPORT_BODY_CACHE_SIZE') or 4096)
+
+    # Background jobs; with REPORT_QUEUE_ENABLED, reports are generated by `flask jobs work`
+    REPORT_QUEUE_ENABLED = os.environ.get('REPORT_QUEUE_ENABLED', 'false').lower() in ['true', 'on', '1']
+    REPORT_STATUS_MAX_WAIT = float(os.environ.get('REPORT_STATUS_MAX_WAIT') or 20)
+    JOB_VISIBILITY_TIMEOUT = int(os.environ.get('JOB_VISIBILITY_TIMEOUT') or 300)
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS') or 5)
+    # Stripe webhooks are stored and acknowledged, then applied by `flask webhooks work`
+    WEBHOOK_INBOX_ENABLED = os.environ.get('WEBHOOK_INBOX_ENABLED', 'false').lower() in ['true', 'on', '1']
+    # Seconds the payment status long-poll waits for the webhook before asking Stripe
+    PAYMENT_CONFIRM_TIMEOUT = float(os.environ.get('PAYMENT_CONFIRM_TIMEOUT') or 10)
+    # Seconds between Stripe retrieves for one pending payment, and how long its page keeps polling
+    PAYMENT_REFRESH_INTERVAL = int(os.environ.get('PAYMENT_REFRESH_INTERVAL') or 60)
+    PAYMENT_POLL_LIMIT = int(os.environ.get('PAYMENT_POLL_LIMIT') or 120)
+
+    # SQL instrumentation: X-Query-* headers (always on in debug), N+1 warnings and query budgets
+    QUERY_STATS_HEADER = os.environ.get('QUERY_STATS_HEADER', 'false').lower() in ['true', 'on', '1']
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD') or 5)
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() in ['true', 'on', '1']
+
+    # Days before the rollup watermark that `flask metrics rollup` recomputes
+    DAILY_METRICS_LOOKBACK_DAYS = int(os.environ.get('DAILY_METRICS_LOOKBACK_DAYS') or 3)
+
+    # Assessments read and scored per batch by the research export
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 1000)
+
+    # Partner scoring API
+    SCORING_API_KEYS = [key for key in (os.environ.get('SCORING_API_KEYS') or '').split(',') if key]
+    SCORING_BATCH_LIMIT = int(os.environ.get('SCORING_BATCH_LIMIT') or 10000)
 
     # Application settings
     POSTS_PER_PAGE = 10
+    ASSESSMENTS_PER_PAGE = int(os.environ.get('ASSESSMENTS_PER_PAGE') or 20)
+    REPORTS_PER_PAGE = int(os.environ.get('REPORTS_PER_PAGE') or 12)
+    ADMIN_PER_PAGE = int(os.environ.get('ADMIN_PER_PAGE') or 20)
+    # Show list totals from the stat counters (approximate, but no COUNT(*) per page)
+    ADMIN_APPROXIMATE_TOTALS = os.environ.get('ADMIN_APPROXIMATE_TOTALS', 'true').lower() in ['true', 'on', '1']
     LANGUAGES = ['en', 'es']
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""Gunicorn settings, loaded automatically when gunicorn starts from this directory.
+
+The report and payment status endpoints long-poll for up to
+REPORT_STATUS_MAX_WAIT or PAYMENT_CONFIRM_TIMEOUT seconds. Workers are
+therefore threaded: a waiting poll holds one thread, not a whole worker
+process. Sync workers are still supported, but long-polls then degrade to
+plain polling (see app.long_poll).
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS') or 16)
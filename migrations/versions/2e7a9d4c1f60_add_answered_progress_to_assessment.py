@@ -0,0 +1,76 @@
+"""Add answered count and bitmap to assessment
+
+Revision ID: 2e7a9d4c1f60
+Revises: 9c3f1a6d2b87
+Create Date: 2025-10-11 15:20:48.903115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e7a9d4c1f60'
+down_revision = '9c3f1a6d2b87'
+branch_labels = None
+depends_on = None
+
+CHUNK_SIZE = 1000
+
+
+def _bitmap(indexes):
+    bitmap = bytearray((max(indexes) // 8 + 1) if indexes else 0)
+    for i in indexes:
+        bitmap[i // 8] |= 1 << (i % 8)
+    return bytes(bitmap)
+
+
+def upgrade():
+    with op.batch_alter_table('assessment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('answered_count', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('answered_bitmap', sa.LargeBinary(), nullable=True))
+
+    # Backfill from existing answers, CHUNK_SIZE assessments at a time. Question
+    # ids run 1..N in plan order, so question id q is bit q - 1 (and byte q - 1
+    # of a packed answer vector). Responses are read in one streamed pass in
+    # assessment order (response.assessment_id has no index yet) and merged
+    # into the chunk they belong to.
+    bind = op.get_bind()
+    assessment = sa.table('assessment',
+                          sa.column('id', sa.Integer),
+                          sa.column('answered_count', sa.Integer),
+                          sa.column('answered_bitmap', sa.LargeBinary))
+    backfill = assessment.update().where(assessment.c.id == sa.bindparam('assessment_id')).values(
+        answered_count=sa.bindparam('count'),
+        answered_bitmap=sa.bindparam('bitmap')
+    )
+    responses = iter(bind.execute(
+        sa.text('SELECT DISTINCT assessment_id, question_id FROM response ORDER BY assessment_id'),
+        execution_options={'stream_results': True}
+    ))
+    response = next(responses, None)
+    after_id = 0
+    while True:
+        chunk = bind.execute(
+            sa.text('SELECT id, answer_vector FROM assessment WHERE id > :after_id ORDER BY id LIMIT :limit'),
+            {'after_id': after_id, 'limit': CHUNK_SIZE}
+        ).all()
+        if not chunk:
+            break
+        after_id = chunk[-1].id
+
+        answered = {assessment_id: {i for i, value in enumerate(answer_vector or b'') if value}
+                    for assessment_id, answer_vector in chunk}
+        while response is not None and response.assessment_id <= after_id:
+            if response.assessment_id in answered:
+                answered[response.assessment_id].add(response.question_id - 1)
+            response = next(responses, None)
+
+        bind.execute(backfill, [{'assessment_id': assessment_id, 'count': len(indexes), 'bitmap': _bitmap(sorted(indexes))}
+                                for assessment_id, indexes in answered.items()])
+
+
+def downgrade():
+    with op.batch_alter_table('assessment', schema=None) as batch_op:
+        batch_op.drop_column('answered_bitmap')
+        batch_op.drop_column('answered_count')
@@ -0,0 +1,29 @@
+"""Add job checkpoint table
+
+Revision ID: 3f9a1c7d2e41
+Revises: 8478d8d8952f
+Create Date: 2025-10-02 10:14:22.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c7d2e41'
+down_revision = '8478d8d8952f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_checkpoint',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('position', sa.String(length=255), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('job_checkpoint')
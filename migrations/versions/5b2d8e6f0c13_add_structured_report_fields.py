@@ -0,0 +1,33 @@
+"""Add structured report fields
+
+Revision ID: 5b2d8e6f0c13
+Revises: a7c4e2b91d05
+Create Date: 2025-10-06 11:27:45.660213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2d8e6f0c13'
+down_revision = 'a7c4e2b91d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing reports keep their HTML content; `flask reports regenerate` converts them
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('overall_score', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('category', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('data', sa.JSON(), nullable=True))
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade():
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('data')
+        batch_op.drop_column('category')
+        batch_op.drop_column('overall_score')
@@ -0,0 +1,62 @@
+"""Add composite indexes for hot lookups and unique response per question
+
+Revision ID: 6f4b8c2e9a31
+Revises: 2e7a9d4c1f60
+Create Date: 2025-10-12 10:41:09.226417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f4b8c2e9a31'
+down_revision = '2e7a9d4c1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the latest response per question before making the pair unique
+    op.execute(
+        "DELETE FROM response WHERE id NOT IN "
+        "(SELECT MAX(id) FROM response GROUP BY assessment_id, question_id)"
+    )
+
+    with op.batch_alter_table('response', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_response_assessment_question', ['assessment_id', 'question_id'])
+
+    with op.batch_alter_table('assessment', schema=None) as batch_op:
+        batch_op.create_index('ix_assessment_user_type_completed', ['user_id', 'type', 'completed', 'payment_id'], unique=False)
+        batch_op.create_index('ix_assessment_created_at', ['created_at'], unique=False)
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_user_type_status', ['user_id', 'assessment_type', 'status'], unique=False)
+        batch_op.create_index('ix_payment_created_at', ['created_at'], unique=False)
+
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.create_index('ix_report_assessment_generated', ['assessment_id', 'generated_at'], unique=False)
+        batch_op.create_index('ix_report_generated_at', ['generated_at'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_created_at', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_created_at')
+
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.drop_index('ix_report_generated_at')
+        batch_op.drop_index('ix_report_assessment_generated')
+
+    with op.batch_alter_table('payment', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_created_at')
+        batch_op.drop_index('ix_payment_user_type_status')
+
+    with op.batch_alter_table('assessment', schema=None) as batch_op:
+        batch_op.drop_index('ix_assessment_created_at')
+        batch_op.drop_index('ix_assessment_user_type_completed')
+
+    with op.batch_alter_table('response', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_response_assessment_question', type_='unique')
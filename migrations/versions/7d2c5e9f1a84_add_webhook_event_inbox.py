@@ -0,0 +1,43 @@
+"""Add Stripe webhook event inbox
+
+Revision ID: 7d2c5e9f1a84
+Revises: f1b9c3e6a4d7
+Create Date: 2025-10-14 15:26:09.481736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2c5e9f1a84'
+down_revision = 'f1b9c3e6a4d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('webhook_event',
+    sa.Column('id', sa.String(length=255), nullable=False),
+    sa.Column('type', sa.String(length=100), nullable=False),
+    sa.Column('payment_intent_id', sa.String(length=255), nullable=True),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('stripe_created', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=True),
+    sa.Column('applied_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('webhook_event', schema=None) as batch_op:
+        batch_op.create_index('ix_webhook_event_status_run_after', ['status', 'run_after'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('webhook_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_webhook_event_status_run_after')
+
+    op.drop_table('webhook_event')
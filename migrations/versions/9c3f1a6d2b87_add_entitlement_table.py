@@ -0,0 +1,46 @@
+"""Add entitlement table and backfill it from succeeded payments
+
+Revision ID: 9c3f1a6d2b87
+Revises: e8b35a1f6c92
+Create Date: 2025-10-10 11:02:37.184203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3f1a6d2b87'
+down_revision = 'e8b35a1f6c92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('entitlement',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('product', sa.String(length=50), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=True),
+    sa.Column('granted_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['payment_id'], ['payment.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'product', name='uq_entitlement_user_product')
+    )
+
+    # One entitlement per user and product, granted by their earliest succeeded payment
+    op.execute(
+        "INSERT INTO entitlement (user_id, product, payment_id, granted_at, updated_at) "
+        "SELECT user_id, assessment_type, MIN(id), MIN(COALESCE(updated_at, created_at)), CURRENT_TIMESTAMP "
+        "FROM payment WHERE status = 'succeeded' "
+        "GROUP BY user_id, assessment_type"
+    )
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('is_premium', sa.Boolean))
+    op.execute(user.update().where(user.c.id.in_(sa.text(
+        "SELECT user_id FROM entitlement WHERE product = 'premium' AND payment_id IS NOT NULL"
+    ))).values(is_premium=True))
+
+def downgrade():
+    op.drop_table('entitlement')
@@ -0,0 +1,27 @@
+"""Add packed answer vector to assessment
+
+Revision ID: a7c4e2b91d05
+Revises: 3f9a1c7d2e41
+Create Date: 2025-10-03 15:42:08.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c4e2b91d05'
+down_revision = '3f9a1c7d2e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing assessments keep their Response rows; run `flask answers pack` to convert them
+    with op.batch_alter_table('assessment', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('answer_vector', sa.LargeBinary(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('assessment', schema=None) as batch_op:
+        batch_op.drop_column('answer_vector')
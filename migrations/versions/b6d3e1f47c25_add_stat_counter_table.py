@@ -0,0 +1,37 @@
+"""Add stat counter table for the admin dashboard
+
+Revision ID: b6d3e1f47c25
+Revises: 6f4b8c2e9a31
+Create Date: 2025-10-13 09:12:54.671380
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3e1f47c25'
+down_revision = '6f4b8c2e9a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stat_counter',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Seed the counters; `flask stats reconcile` recomputes them the same way
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'users', COUNT(*) FROM \"user\"")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'assessments', COUNT(*) FROM assessment")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'assessments_completed', COUNT(*) FROM assessment WHERE completed")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'assessments_' || type, COUNT(*) FROM assessment GROUP BY type")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'payments', COUNT(*) FROM payment")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'payments_succeeded', COUNT(*) FROM payment WHERE status = 'succeeded'")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'revenue_cents', COALESCE(SUM(amount), 0) FROM payment WHERE status = 'succeeded'")
+
+
+def downgrade():
+    op.drop_table('stat_counter')
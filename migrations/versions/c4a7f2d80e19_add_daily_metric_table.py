@@ -0,0 +1,29 @@
+"""Add daily metric rollup table
+
+Revision ID: c4a7f2d80e19
+Revises: b6d3e1f47c25
+Create Date: 2025-10-13 16:37:21.058214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7f2d80e19'
+down_revision = 'b6d3e1f47c25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_metric',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('metric', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'metric')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_metric')
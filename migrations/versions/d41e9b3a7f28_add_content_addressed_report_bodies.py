@@ -0,0 +1,38 @@
+"""Add content-addressed report bodies
+
+Revision ID: d41e9b3a7f28
+Revises: 5b2d8e6f0c13
+Create Date: 2025-10-07 16:05:31.174552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41e9b3a7f28'
+down_revision = '5b2d8e6f0c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('report_body',
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('digest')
+    )
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('body_digest', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_report_body_digest'), ['body_digest'], unique=False)
+        batch_op.create_foreign_key('fk_report_body_digest', 'report_body', ['body_digest'], ['digest'])
+
+
+def downgrade():
+    with op.batch_alter_table('report', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_report_body_digest', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_report_body_digest'))
+        batch_op.drop_column('body_digest')
+
+    op.drop_table('report_body')
@@ -0,0 +1,25 @@
+"""Seed the reports stat counter
+
+Revision ID: f1b9c3e6a4d7
+Revises: c4a7f2d80e19
+Create Date: 2025-10-14 10:04:38.215907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b9c3e6a4d7'
+down_revision = 'c4a7f2d80e19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("DELETE FROM stat_counter WHERE name = 'reports'")
+    op.execute("INSERT INTO stat_counter (name, value) SELECT 'reports', COUNT(*) FROM report")
+
+
+def downgrade():
+    op.execute("DELETE FROM stat_counter WHERE name = 'reports'")
@@ -0,0 +1,24 @@
+import pytest
+from flask_migrate import upgrade
+from config import Config
+from app import create_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app on a SQLite database migrated to the latest revision"""
+
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SQLALCHEMY_BINDS = {}
+        WTF_CSRF_ENABLED = False
+        # Views over their query budget raise instead of logging
+        QUERY_BUDGET_STRICT = True
+        QUERY_STATS_HEADER = True
+        NORMS_FILE = str(tmp_path / 'norms.dat')
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        upgrade()
+    return app
@@ -0,0 +1,128 @@
+import re
+from functools import lru_cache
+import pytest
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Assessment, Payment
+from app.assessment.answers import init_answer_storage, save_answers
+from app.payment.entitlements import sync_entitlement
+from app.query_stats import query_budget, QueryBudgetExceeded
+from app.reports.tasks import generate_report_for
+
+ADMIN_EMAIL = 'vicgupta@gmail.com'
+PASSWORD = 'password123'
+
+# Enough rows that a per-row query on any list page would blow its budget
+USERS = 25
+
+
+@lru_cache(maxsize=None)
+def _password_hash():
+    # Hashing is deliberately slow; every seeded user shares one hash
+    return generate_password_hash(PASSWORD)
+
+
+def _add_user(email):
+    user = User(email=email, password_hash=_password_hash())
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def _complete(user, assessment_type, payment=None):
+    assessment = Assessment(user_id=user.id, type=assessment_type, payment_id=payment.id if payment else None)
+    init_answer_storage(assessment)
+    db.session.add(assessment)
+    db.session.flush()
+    if assessment_type == 'premium':
+        save_answers(assessment, {question_id: str(question_id % 5 + 1) for question_id in range(1, 85)})
+    else:
+        save_answers(assessment, {question_id: 'Agree' for question_id in range(1, 11)})
+    assessment.completed = True
+    return generate_report_for(assessment)
+
+
+def _pay(user):
+    payment = Payment(user_id=user.id, stripe_payment_intent_id=f'pi_test_{user.id}', amount=1000,
+                      currency='usd', status='succeeded', assessment_type='premium')
+    db.session.add(payment)
+    db.session.flush()
+    sync_entitlement(user.id, 'premium')
+    db.session.commit()
+    return payment
+
+
+@pytest.fixture
+def seeded(app):
+    """Users with completed simple and premium assessments and their reports"""
+    with app.app_context():
+        _add_user(ADMIN_EMAIL)
+        for i in range(USERS):
+            user = _add_user(f'user{i}@example.com')
+            _complete(user, 'simple')
+            _complete(user, 'premium', _pay(user))
+        # A paying user part-way through the premium assessment
+        _pay(_add_user('taker@example.com'))
+        db.session.commit()
+    return app
+
+
+def _login(client, email):
+    response = client.post('/auth/login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302
+
+
+def _get(client, url):
+    # Over budget, the view raises QueryBudgetExceeded (QUERY_BUDGET_STRICT)
+    response = client.get(url)
+    assert response.status_code == 200, url
+    assert int(response.headers['X-Query-Count']) > 0
+    return response
+
+
+@pytest.mark.parametrize('url', [
+    '/admin/users',
+    '/admin/payments',
+    '/admin/payments?status=succeeded',
+    '/admin/assessments',
+    '/admin/assessments?type=premium',
+    '/admin/reports',
+])
+def test_admin_lists_stay_within_budget(seeded, client, url):
+    _login(client, ADMIN_EMAIL)
+    _get(client, url)
+
+
+def test_dashboard_and_report_view_stay_within_budget(seeded, client):
+    _login(client, 'user0@example.com')
+    _get(client, '/dashboard/index')
+    _get(client, '/dashboard/reports')
+    with seeded.app_context():
+        report = User.query.filter_by(email='user0@example.com').one().reports.first()
+    _get(client, f'/reports/view/{report.id}')
+
+
+def test_premium_questions_stay_within_budget(seeded, client):
+    _login(client, 'taker@example.com')
+    assert client.get('/assessment/premium').status_code == 302
+    _get(client, '/assessment/premium/question/1')
+    response = client.post('/assessment/premium/question/1', data={'answer': '4'})
+    assert response.status_code == 302
+
+
+def test_premium_pages_stay_within_budget(seeded, client):
+    seeded.config['PREMIUM_PAGE_SIZE'] = 'category'
+    _login(client, 'taker@example.com')
+    assert client.get('/assessment/premium').status_code == 302
+    page = _get(client, '/assessment/premium/page/1')
+    answers = {name: '3' for name in set(re.findall(r'name="(answer_\d+)"', page.get_data(as_text=True)))}
+    assert answers
+    response = client.post('/assessment/premium/page/1', data=answers)
+    assert response.status_code == 302
+
+
+def test_strict_budget_raises(app):
+    with app.app_context():
+        with pytest.raises(QueryBudgetExceeded):
+            with query_budget(0):
+                User.query.all()
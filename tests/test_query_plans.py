@@ -0,0 +1,18 @@
+from app import db
+from app.query_plans import HOT_QUERIES, check_plans
+
+
+def test_hot_queries_use_an_index(app):
+    lines = []
+    with app.app_context():
+        failures = check_plans(echo=lines.append)
+    assert failures == [], '\n'.join(lines)
+    assert len(lines) == len(HOT_QUERIES)
+
+
+def test_other_databases_are_skipped(app, monkeypatch):
+    lines = []
+    with app.app_context():
+        monkeypatch.setattr(db.engine.dialect, 'name', 'mysql')
+        assert check_plans(echo=lines.append) is None
+    assert lines == ['SKIP query plans are not checked on mysql, only on sqlite and postgresql']